@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 from langchain_core.messages import HumanMessage
 from agent.graph import graph
 
@@ -33,7 +34,7 @@ def main() -> None:
         "reasoning_model": args.reasoning_model,
     }
 
-    result = graph.invoke(state)
+    result = asyncio.run(graph.ainvoke(state))
     messages = result.get("messages", [])
     if messages:
         print(messages[-1].content)
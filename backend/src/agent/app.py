@@ -1,32 +1,116 @@
 # mypy: disable - error - code = "no-untyped-def,misc"
+import asyncio
+import contextlib
+import functools
+import json
 import os
-import pathlib
 import logging
+from typing import Optional
 from fastapi import FastAPI, Response
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
 
 # Define the FastAPI app
 app = FastAPI()
 
+# Frontend build location inside the container
+_BUILD_DIR = "/deps/frontend/dist"
+
+# Origins of the frontend dev server and the bundled frontend
+DEFAULT_ALLOWED_ORIGINS = (
+    "http://localhost:5173",
+    "http://127.0.0.1:5173",
+    "http://localhost:8123",
+    "http://127.0.0.1:8123",
+)
+
 # Configure allowed origins for CORS
 allowed_origins_env = os.getenv("ALLOWED_ORIGINS")
 if allowed_origins_env:
-    allowed_origins = [origin.strip() for origin in allowed_origins_env.split(",") if origin.strip()]
+    allowed_origins = tuple(origin.strip() for origin in allowed_origins_env.split(",") if origin.strip())
 else:
-    allowed_origins = ["*"]  # WARNING: In production, set ALLOWED_ORIGINS to restrict this to your frontend domain(s)
+    allowed_origins = DEFAULT_ALLOWED_ORIGINS  # In production, set ALLOWED_ORIGINS to your frontend domain(s)
+
+# Optional regex for wildcard subdomains, e.g. https://.*\.example\.com
+allowed_origin_regex = os.getenv("ALLOWED_ORIGIN_REGEX")
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=allowed_origins,  # In production, restrict this to your frontend domain
-    allow_credentials=True,
+    allow_origins=allowed_origins,
+    allow_origin_regex=allowed_origin_regex,
+    # Credentials with a wildcard origin make Starlette reflect each request's Origin
+    allow_credentials="*" not in allowed_origins,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def setup_llm_cache():
+    """Install the exact-match LLM cache once per process."""
+    from agent.llm_cache import setup_llm_caching
+
+    setup_llm_caching()
+
+@app.on_event("startup")
+async def warm_llms():
+    """Build the graph's LLMs before the first request and open their connections."""
+    from agent.configuration import Configuration
+    from agent.llm_factory import (
+        GRAPH_LLM_SEMANTIC_CACHE,
+        GRAPH_LLM_TEMPERATURES,
+        LLMFactory,
+        open_http_clients,
+    )
+
+    # A previous lifespan in this process (e.g. a test client) closed the pools
+    open_http_clients()
+    factory = LLMFactory(Configuration.from_runnable_config())
+    model_types = list(GRAPH_LLM_TEMPERATURES)
+    llms = await asyncio.gather(*(
+        asyncio.to_thread(
+            factory.create_llm,
+            model_type,
+            GRAPH_LLM_TEMPERATURES[model_type],
+            2,
+            GRAPH_LLM_SEMANTIC_CACHE[model_type],
+        )
+        for model_type in model_types
+    ))
+    # Same arguments as the graph nodes, so factories hand them these memoized instances
+    app.state.llms = dict(zip(model_types, llms))
+
+    async def ping():
+        from langchain_core.messages import HumanMessage
+
+        # _agenerate skips the LLM caches, which would otherwise answer the
+        # deterministic models from disk without opening a connection
+        results = await asyncio.gather(
+            *(llm._agenerate([HumanMessage("ping")]) for llm in llms),
+            return_exceptions=True,
+        )
+        for model_type, result in zip(model_types, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Warm-up request for {model_type} LLM failed: {result}")
+
+    # Handshake and auth happen in the background so startup isn't delayed
+    app.state.llm_warmup = asyncio.create_task(ping())
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Stop the warm-up requests and close the shared OpenRouter connection pools."""
+    from agent.llm_factory import aclose_http_clients
+
+    warmup = getattr(app.state, "llm_warmup", None)
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await warmup
+    await aclose_http_clients()
+
 @app.get("/")
 async def root():
     """Root endpoint with API information and frontend access."""
@@ -39,17 +123,14 @@ async def root():
         "openapi": "/openapi.json"
     }
 
-@app.get("/api/models")
-async def get_available_models():
-    """Get available models including OpenRouter models."""
+def _build_models_payload():
+    """Build the /api/models response body from the static model catalogues."""
     from agent.openrouter_config import OpenRouterConfig
-    from agent.configuration import Configuration
-    
+
     # Get OpenRouter models
-    openrouter_config = OpenRouterConfig()
     openrouter_models = []
-    
-    for model_name, model_info in openrouter_config.FREE_MODELS.items():
+
+    for model_name, model_info in OpenRouterConfig.FREE_MODELS.items():
         openrouter_models.append({
             "id": model_name,
             "name": model_name,
@@ -59,7 +140,7 @@ async def get_available_models():
             "context_length": model_info["context_length"],
             "description": f"Free {model_info['provider']} model via OpenRouter"
         })
-    
+
     # Get Gemini models
     gemini_models = [
         {
@@ -90,12 +171,68 @@ async def get_available_models():
             "description": "High-quality Gemini Pro model"
         }
     ]
-    
+
     return {
         "models": openrouter_models + gemini_models,
         "default_model": "gpt-oss-20b"
     }
 
+# The model list is static, so build it once at import
+_MODELS_PAYLOAD = _build_models_payload()
+
+@functools.lru_cache(maxsize=1)
+def _models_json() -> bytes:
+    """Serialize the model list the same way FastAPI's JSONResponse would."""
+    return json.dumps(
+        _MODELS_PAYLOAD, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+@app.get("/api/models")
+async def get_available_models():
+    """Get available models including OpenRouter models."""
+    # Returning a Response directly skips FastAPI's per-request serialization
+    return Response(content=_models_json(), media_type="application/json")
+
+class AnswerStreamRequest(BaseModel):
+    """Request body for streaming an answer."""
+
+    prompt: str
+    model: Optional[str] = None
+
+@app.post("/api/answer/stream")
+async def stream_answer(request: AnswerStreamRequest):
+    """Stream the answer model's completion for a prompt as server-sent events."""
+    from agent.configuration import Configuration
+    from agent.llm_factory import (
+        GRAPH_LLM_SEMANTIC_CACHE,
+        GRAPH_LLM_TEMPERATURES,
+        LLMFactory,
+        stream_semaphore,
+    )
+
+    configurable = {"reasoning_model": request.model} if request.model else {}
+    llm_factory = LLMFactory(Configuration.from_runnable_config({"configurable": configurable}))
+    # Built like the graph's answer model, so this reuses the prewarmed instance
+    llm = llm_factory.create_llm(
+        "answer",
+        temperature=GRAPH_LLM_TEMPERATURES["answer"],
+        max_retries=2,
+        semantic_cache=GRAPH_LLM_SEMANTIC_CACHE["answer"],
+    )
+
+    async def events():
+        try:
+            async with stream_semaphore():
+                async for chunk in llm.astream(request.prompt):
+                    if chunk.content:
+                        yield f"data: {json.dumps({'content': chunk.content})}\n\n"
+        except Exception as e:
+            logger.error(f"Answer stream failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 
 def create_frontend_router(build_dir="frontend/dist"):
     """Creates a router to serve the React frontend.
@@ -107,11 +244,9 @@ def create_frontend_router(build_dir="frontend/dist"):
         A Starlette application serving the frontend.
     """
     # Use absolute path since we know the container structure
-    build_path = pathlib.Path("/deps/frontend/dist")
-
-    if not build_path.is_dir() or not (build_path / "index.html").is_file():
+    if not (os.path.isdir(_BUILD_DIR) and os.path.isfile(_BUILD_DIR + "/index.html")):
         logger.warning(
-            f"WARN: Frontend build directory not found or incomplete at {build_path}. Serving frontend will likely fail."
+            f"WARN: Frontend build directory not found or incomplete at {_BUILD_DIR}. Serving frontend will likely fail."
         )
         # Return a dummy router if build isn't ready
         from starlette.routing import Route
@@ -125,7 +260,9 @@ def create_frontend_router(build_dir="frontend/dist"):
 
         return Route("/{path:path}", endpoint=dummy_frontend)
 
-    return StaticFiles(directory=build_path, html=True)
+    from agent.static_files import PrecompressedStaticFiles
+
+    return PrecompressedStaticFiles(directory=_BUILD_DIR, html=True)
 
 
 # Mount the frontend under /app to not conflict with the LangGraph API routes
@@ -1,10 +1,17 @@
+import functools
 import os
 from pydantic import BaseModel, Field
-from typing import Any, Optional
+from typing import Any, FrozenSet, Optional, Tuple
 
 from langchain_core.runnables import RunnableConfig
 
 
+@functools.cache
+def _default_gemini_api_key() -> Optional[str]:
+    # Read once, on first use, so a .env loaded at startup is still picked up
+    return os.getenv("GEMINI_API_KEY")
+
+
 class Configuration(BaseModel):
     """The configuration for the agent."""
 
@@ -45,13 +52,48 @@ class Configuration(BaseModel):
         }
     )
 
+    use_semantic_cache: bool = Field(
+        default=False,
+        metadata={
+            "description": "Whether to answer low-temperature calls from the semantic response cache (requires the 'cache' extras)"
+        }
+    )
+
     gemini_api_key: str = Field(
-        default_factory=lambda: os.getenv("GEMINI_API_KEY"),
+        default_factory=_default_gemini_api_key,
         metadata={
             "description": "Google Gemini API key for fallback"
         }
     )
 
+    gemini_cached_content: Optional[str] = Field(
+        default=None,
+        metadata={
+            "description": "Name of a Gemini cached content resource holding the shared prompt prefix"
+        }
+    )
+
+    use_batch_api: bool = Field(
+        default=False,
+        metadata={
+            "description": "Whether to send the final answer through the OpenAI Batch API for latency-tolerant runs (requires OPENAI_API_KEY)"
+        }
+    )
+
+    batch_model: str = Field(
+        default="gpt-4o-mini",
+        metadata={
+            "description": "OpenAI model id used for Batch API answers"
+        }
+    )
+
+    batch_base_url: Optional[str] = Field(
+        default=None,
+        metadata={
+            "description": "Override for the Batch API base URL; the endpoint must implement the OpenAI Files and Batch APIs"
+        }
+    )
+
     number_of_initial_queries: int = Field(
         default=3,
         metadata={"description": "The number of initial search queries to generate."},
@@ -66,27 +108,54 @@ class Configuration(BaseModel):
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
     ) -> "Configuration":
-        """Create a Configuration instance from a RunnableConfig."""
+        """Create a Configuration instance from a RunnableConfig.
+
+        Instances are memoized by their resolved values and shared between
+        callers, so treat the result as read-only.
+        """
         configurable = (
             config["configurable"] if config and "configurable" in config else {}
         )
 
         # Get raw values from environment or config
         raw_values: dict[str, Any] = {
-            name: os.environ.get(name.upper(), configurable.get(name))
-            for name in cls.model_fields.keys()
+            name: os.environ.get(env_name, configurable.get(name))
+            for name, env_name in _ENV_NAMES
         }
 
         # Filter out None values
         values = {k: v for k, v in raw_values.items() if v is not None}
 
-        # Create the configuration instance
-        config_instance = cls(**values)
-        
-        # If reasoning_model is provided, override all the default models
-        if config_instance.reasoning_model:
-            config_instance.query_generator_model = config_instance.reasoning_model
-            config_instance.reflection_model = config_instance.reasoning_model
-            config_instance.answer_model = config_instance.reasoning_model
+        try:
+            key = frozenset(values.items())
+        except TypeError:
+            # Unhashable configurable values can't be memoized
+            return _create_config(cls, values)
+        return _build_config(cls, key)
+
+
+# Field names paired with the environment variables that override them
+_ENV_NAMES: Tuple[Tuple[str, str], ...] = tuple(
+    (name, name.upper()) for name in Configuration.model_fields
+)
+
+
+def _create_config(cls: type[Configuration], values: dict[str, Any]) -> Configuration:
+    """Validate values into a Configuration, applying the reasoning_model override."""
+    # If reasoning_model is provided, override all the default models
+    reasoning_model = values.get("reasoning_model")
+    if reasoning_model:
+        values = {
+            **values,
+            "query_generator_model": reasoning_model,
+            "reflection_model": reasoning_model,
+            "answer_model": reasoning_model,
+        }
+    return cls(**values)
+
 
-        return config_instance
+@functools.lru_cache(maxsize=64)
+def _build_config(
+    cls: type[Configuration], items: FrozenSet[Tuple[str, Any]]
+) -> Configuration:
+    return _create_config(cls, dict(items))
@@ -30,7 +30,13 @@ from agent.utils import (
     insert_citation_markers,
     resolve_urls,
 )
-from agent.llm_factory import LLMFactory
+from agent.llm_factory import (
+    GEMINI_API_KEY,
+    GRAPH_LLM_SEMANTIC_CACHE,
+    GRAPH_LLM_TEMPERATURES,
+    LLMFactory,
+    llm_semaphore,
+)
 
 load_dotenv()
 
@@ -42,7 +48,7 @@ genai_client = Client(api_key=os.getenv("GEMINI_API_KEY"))
 
 
 # Nodes
-def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
+async def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
     """LangGraph node that generates search queries based on the User's question.
 
     Uses Gemini 2.0 Flash to create an optimized search queries for web research based on
@@ -69,7 +75,12 @@ def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerati
 
     # Use LLM factory to create the appropriate LLM
     llm_factory = LLMFactory(configurable)
-    llm = llm_factory.create_llm("query_generator", temperature=1.0, max_retries=2)
+    llm = llm_factory.create_llm(
+        "query_generator",
+        temperature=GRAPH_LLM_TEMPERATURES["query_generator"],
+        max_retries=2,
+        semantic_cache=GRAPH_LLM_SEMANTIC_CACHE["query_generator"],
+    )
     
     try:
         structured_llm = llm.with_structured_output(SearchQueryList)
@@ -82,7 +93,8 @@ def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerati
             number_queries=state["initial_search_query_count"],
         )
         # Generate the search queries
-        result = structured_llm.invoke(formatted_prompt)
+        async with llm_semaphore():
+            result = await structured_llm.ainvoke(formatted_prompt)
         return {"search_query": result.query}
     except Exception as e:
         # Fallback to non-structured output if structured output fails
@@ -94,7 +106,8 @@ def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerati
             number_queries=state["initial_search_query_count"],
         )
         # Generate the search queries without structured output
-        result = llm.invoke(formatted_prompt)
+        async with llm_semaphore():
+            result = await llm.ainvoke(formatted_prompt)
         # Parse the result manually or return a default
         return {"search_query": [f"research query {i+1}" for i in range(state["initial_search_query_count"])]}
 
@@ -114,7 +127,7 @@ def continue_to_web_research(state: QueryGenerationState):
     ]
 
 
-def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
+async def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     """LangGraph node that performs web research using the native Google Search API tool.
 
     Executes a web search using the native Google Search API tool in combination with Gemini 2.0 Flash.
@@ -136,7 +149,12 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     
     # Use LLM factory for the search model
     llm_factory = LLMFactory(configurable)
-    search_llm = llm_factory.create_llm("query_generator", temperature=0, max_retries=2)
+    search_llm = llm_factory.create_llm(
+        "query_generator",
+        temperature=0,
+        max_retries=2,
+        semantic_cache=GRAPH_LLM_SEMANTIC_CACHE["query_generator"],
+    )
     
     # If using OpenRouter, we need to fall back to Gemini for Google Search API
     # since OpenRouter doesn't have native Google Search integration
@@ -146,7 +164,7 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
             model="gemini-2.0-flash",
             temperature=0,
             max_retries=2,
-            api_key=os.getenv("GEMINI_API_KEY"),
+            api_key=GEMINI_API_KEY,
         )
     
     try:
@@ -155,14 +173,15 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
             research_topic=state["search_query"],
         )
         # Uses the google genai client as the langchain client doesn't return grounding metadata
-        response = genai_client.models.generate_content(
-            model=configurable.query_generator_model,
-            contents=formatted_prompt,
-            config={
-                "tools": [{"google_search": {}}],
-                "temperature": 0,
-            },
-        )
+        async with llm_semaphore():
+            response = await genai_client.aio.models.generate_content(
+                model=configurable.query_generator_model,
+                contents=formatted_prompt,
+                config={
+                    "tools": [{"google_search": {}}],
+                    "temperature": 0,
+                },
+            )
         # resolve the urls to short urls for saving tokens and time
         resolved_urls = resolve_urls(
             response.candidates[0].grounding_metadata.grounding_chunks, state["id"]
@@ -187,7 +206,7 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
         }
 
 
-def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+async def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
     """LangGraph node that identifies knowledge gaps and generates potential follow-up queries.
 
     Analyzes the current summary to identify areas for further research and generates
@@ -222,10 +241,16 @@ def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
     
     # Use LLM factory
     llm_factory = LLMFactory(configurable)
-    llm = llm_factory.create_llm("reflection", temperature=1.0, max_retries=2)
+    llm = llm_factory.create_llm(
+        "reflection",
+        temperature=GRAPH_LLM_TEMPERATURES["reflection"],
+        max_retries=2,
+        semantic_cache=GRAPH_LLM_SEMANTIC_CACHE["reflection"],
+    )
     
     try:
-        result = llm.with_structured_output(Reflection).invoke(formatted_prompt)
+        async with llm_semaphore():
+            result = await llm.with_structured_output(Reflection).ainvoke(formatted_prompt)
         
         return {
             "is_sufficient": result.is_sufficient,
@@ -240,7 +265,8 @@ def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
         print(f"Warning: Structured output failed in reflection, falling back to regular output: {e}")
         
         # Use regular LLM output and provide default values
-        result = llm.invoke(formatted_prompt)
+        async with llm_semaphore():
+            result = await llm.ainvoke(formatted_prompt)
         
         return {
             "is_sufficient": True,  # Default to sufficient to avoid infinite loops
@@ -290,7 +316,7 @@ def evaluate_research(
         ]
 
 
-def finalize_answer(state: OverallState, config: RunnableConfig):
+async def finalize_answer(state: OverallState, config: RunnableConfig):
     """LangGraph node that finalizes the research summary.
 
     Prepares the final output by deduplicating and formatting sources, then
@@ -323,20 +349,36 @@ def finalize_answer(state: OverallState, config: RunnableConfig):
     try:
         # Use LLM factory
         llm_factory = LLMFactory(configurable)
-        llm = llm_factory.create_llm("answer", temperature=0, max_retries=2)
-        result = llm.invoke(formatted_prompt)
+        content = None
+        if configurable.use_batch_api:
+            # Latency-tolerant runs trade turnaround time for batch pricing
+            try:
+                run_batch = llm_factory.create_batch_runner(
+                    temperature=GRAPH_LLM_TEMPERATURES["answer"]
+                )
+                content = (await run_batch([formatted_prompt]))[0]
+            except Exception as e:
+                print(f"Warning: Batch API unavailable, generating the answer directly: {e}")
+        if content is None:
+            llm = llm_factory.create_llm(
+                "answer",
+                temperature=GRAPH_LLM_TEMPERATURES["answer"],
+                max_retries=2,
+                semantic_cache=GRAPH_LLM_SEMANTIC_CACHE["answer"],
+            )
+            async with llm_semaphore():
+                result = await llm.ainvoke(formatted_prompt)
+            content = result.content
 
         # Replace the short urls with the original urls and add all used urls to the sources_gathered
         unique_sources = []
         for source in state["sources_gathered"]:
-            if source["short_url"] in result.content:
-                result.content = result.content.replace(
-                    source["short_url"], source["value"]
-                )
+            if source["short_url"] in content:
+                content = content.replace(source["short_url"], source["value"])
                 unique_sources.append(source)
 
         return {
-            "messages": [AIMessage(content=result.content)],
+            "messages": [AIMessage(content=content)],
             "sources_gathered": unique_sources,
         }
     except Exception as e:
@@ -0,0 +1,633 @@
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.globals import set_llm_cache
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import generate_from_stream
+from langchain_core.messages import (
+    AIMessageChunk,
+    BaseMessage,
+    get_buffer_string,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+logger = logging.getLogger(__name__)
+
+# Prompts below this temperature are (near-)deterministic, so a cached answer is
+# as good as a fresh one.
+SEMANTIC_CACHE_MAX_TEMPERATURE = 0.3
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+_semantic_cache: Optional["SemanticCache"] = None
+_semantic_cache_lock = threading.Lock()
+
+
+def default_cache_dir() -> Path:
+    """Return the on-disk location for persistent caches."""
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "gemini-langgraph"
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Build a stable exact-match key from a serialized prompt and LLM parameters."""
+    payload = json.dumps({"prompt": prompt, "llm_string": llm_string}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def setup_llm_caching(database_path: Optional[Path] = None) -> None:
+    """Install the exact-match cache as LangChain's global LLM cache.
+
+    An unusable cache location (e.g. a read-only directory) leaves LLM calls
+    uncached rather than failing startup.
+    """
+    try:
+        cache = ExactLLMCache(database_path)
+    except Exception as e:
+        logger.warning(f"Exact LLM cache disabled, failed to initialise: {e}")
+        return
+    set_llm_cache(cache)
+
+
+def _modules_available(*modules: str) -> bool:
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+
+def quantized_embeddings_available() -> bool:
+    """Check whether the int8 ONNX Runtime embedding backend is installed."""
+    return _modules_available("optimum", "onnxruntime", "transformers")
+
+
+def semantic_cache_available() -> bool:
+    """Check whether the optional semantic cache dependencies are installed."""
+    return _modules_available("faiss") and (
+        quantized_embeddings_available() or _modules_available("sentence_transformers")
+    )
+
+
+def get_semantic_cache() -> Optional["SemanticCache"]:
+    """Return the process-wide semantic cache, or None if it cannot be used."""
+    global _semantic_cache
+    if _semantic_cache is not None:
+        return _semantic_cache
+    if not semantic_cache_available():
+        return None
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            try:
+                _semantic_cache = SemanticCache()
+            except Exception as e:
+                logger.warning(f"Semantic cache disabled, failed to initialise: {e}")
+                return None
+    return _semantic_cache
+
+
+class ExactLLMCache(BaseCache):
+    """Exact-match LLM cache persisted to sqlite.
+
+    Entries are keyed by `cache_key` over the serialized messages and the LLM
+    string (model, temperature, bound tools, ...). Models that should not be
+    cached, such as those sampling with temperature > 0, opt out with
+    `cache=False`.
+    """
+
+    def __init__(self, database_path: Optional[Path] = None):
+        path = Path(database_path) if database_path else default_cache_dir() / "exact_cache.sqlite3"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, response TEXT NOT NULL)"
+        )
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """Look up the generations stored for a prompt and LLM string."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM entries WHERE key = ?",
+                (cache_key(prompt, llm_string),),
+            ).fetchone()
+        return _loads_generations(row[0]) if row is not None else None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """Store the generations for a prompt and LLM string."""
+        if not all(isinstance(generation, ChatGeneration) for generation in return_val):
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, response) VALUES (?, ?)",
+                (cache_key(prompt, llm_string), _dumps_generations(return_val)),
+            )
+            self._db.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        """Remove every cached entry."""
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+
+
+class QuantizedEncoder:
+    """Sentence embedder running an int8-quantized ONNX export of the model.
+
+    The model is exported to ONNX and dynamically quantized for AVX-512 VNNI
+    once, then loaded from `model_dir` on later starts. Inputs are truncated
+    to `max_seq_length` tokens (256, sentence-transformers' limit for MiniLM,
+    rather than the tokenizer's 512) and mean pooled over the attention mask,
+    so embeddings approximate sentence-transformers' up to int8 quantization
+    error. `encode` mirrors the subset of `SentenceTransformer.encode` that
+    SemanticCache uses.
+    """
+
+    def __init__(self, model_name: str, model_dir: Path, max_seq_length: int = 256):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        quantized_file = "model_quantized.onnx"
+        if not (model_dir / quantized_file).is_file():
+            from optimum.onnxruntime import ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+            model = ORTModelForFeatureExtraction.from_pretrained(
+                model_name, export=True, provider="CPUExecutionProvider"
+            )
+            quantizer = ORTQuantizer.from_pretrained(model)
+            quantizer.quantize(
+                save_dir=model_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(
+                    is_static=False, per_channel=False
+                ),
+            )
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+
+        self.max_seq_length = max_seq_length
+        self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self._model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name=quantized_file, provider="CPUExecutionProvider"
+        )
+
+    def encode(
+        self,
+        sentences: List[str],
+        normalize_embeddings: bool = False,
+        convert_to_numpy: bool = True,
+    ) -> Any:
+        import numpy as np
+
+        inputs = self._tokenizer(
+            sentences,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        hidden = self._model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+        embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if normalize_embeddings:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+
+class SemanticCache:
+    """Embedding-indexed store of chat completions.
+
+    Prompts are embedded with an int8-quantized ONNX export of the embedding
+    model when optimum is installed (sentence-transformers otherwise) and
+    indexed in an 8-bit scalar-quantized FAISS inner-product index (cosine
+    similarity on normalized vectors). The completions live in a sqlite
+    sidecar next to the index, scoped to the LLM that produced them. Sqlite
+    assigns each completion its id and the index stores vectors under that
+    id, so processes sharing the cache directory never pair a vector with
+    another entry's completion. The index file is replaced atomically and
+    reloaded when another process has written it. Two processes updating at
+    the same moment can still drop one of their vectors; that entry then
+    just misses.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+    ):
+        import faiss
+
+        self._faiss = faiss
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.embedding_model = embedding_model
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Separate from _lock so a slow first model load doesn't block lookups' index access
+        self._encoder_lock = threading.Lock()
+        self._encoder: Any = None
+        # Futures of in-flight async model calls, keyed by `cache_key`, so that
+        # identical concurrent calls share one upstream request no matter which
+        # wrapper they come through. A None result means the call was cancelled.
+        self.inflight: Dict[str, "asyncio.Future[Optional[ChatResult]]"] = {}
+        self._index_path = self.cache_dir / "semantic_cache.faiss"
+        self._index_stamp: Optional[tuple] = None
+        self._db = sqlite3.connect(
+            self.cache_dir / "semantic_cache.sqlite3", check_same_thread=False
+        )
+        # AUTOINCREMENT never reuses the id of a deleted row that the index may still hold
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "row_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "llm_string TEXT NOT NULL, "
+            "prompt TEXT NOT NULL, "
+            "response TEXT NOT NULL, "
+            "expires_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS completions_scope ON completions (llm_string, expires_at)"
+        )
+        self._db.execute("DELETE FROM completions WHERE expires_at <= ?", (time.time(),))
+        self._db.commit()
+        self._index = self._load_index()
+
+    def _stat_index(self) -> Optional[tuple]:
+        """Identify the index file currently on disk, or None if there is none."""
+        try:
+            stat_result = os.stat(self._index_path)
+        except FileNotFoundError:
+            return None
+        return stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size
+
+    def _load_index(self) -> Any:
+        """Memory-map the FAISS index from disk, if one has been written."""
+        self._index_stamp = self._stat_index()
+        if self._index_stamp is None:
+            return None
+        return self._faiss.read_index(str(self._index_path), self._faiss.IO_FLAG_MMAP)
+
+    def _refresh_index(self) -> None:
+        """Reload the index if another process has replaced it since it was loaded."""
+        if self._stat_index() != self._index_stamp:
+            self._index = self._load_index()
+
+    def embed(self, text: str) -> Any:
+        """Embed text into a normalized float32 row vector."""
+        if self._encoder is None:
+            # Concurrent first lookups would otherwise each export the model
+            # into the same directory
+            with self._encoder_lock:
+                if self._encoder is None:
+                    self._encoder = self._load_encoder()
+        vectors = self._encoder.encode(
+            [text], normalize_embeddings=True, convert_to_numpy=True
+        )
+        return vectors.astype("float32")
+
+    def _load_encoder(self) -> Any:
+        """Load the int8 ONNX encoder, falling back to sentence-transformers."""
+        if quantized_embeddings_available():
+            model_dir = self.cache_dir / "onnx-int8" / self.embedding_model.replace("/", "--")
+            try:
+                return QuantizedEncoder(self.embedding_model, model_dir)
+            except Exception as e:
+                logger.warning(f"Quantized embedding model unavailable, using sentence-transformers: {e}")
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(self.embedding_model)
+
+    def _new_index(self, dimension: int) -> Any:
+        """Create an 8-bit scalar-quantized inner-product index with explicit ids."""
+        import numpy as np
+
+        index = self._faiss.IndexScalarQuantizer(
+            dimension, self._faiss.ScalarQuantizer.QT_8bit, self._faiss.METRIC_INNER_PRODUCT
+        )
+        # Normalized embeddings lie in [-1, 1]; training on the bounds fixes the
+        # quantization range without needing sample data
+        index.train(np.stack([-np.ones(dimension), np.ones(dimension)]).astype("float32"))
+        return self._faiss.IndexIDMap2(index)
+
+    def lookup(self, vector: Any, llm_string: str) -> Optional[List[ChatGeneration]]:
+        """Return the cached generations of the closest live match in scope, if any."""
+        import numpy as np
+
+        with self._lock:
+            self._refresh_index()
+            if self._index is None or self._index.ntotal == 0:
+                return None
+            # Search only this scope's live entries, so closer matches from other
+            # conversations or models can't crowd out a valid hit
+            row_ids = np.fromiter(
+                (
+                    row_id
+                    for (row_id,) in self._db.execute(
+                        "SELECT row_id FROM completions WHERE llm_string = ? AND expires_at > ?",
+                        (llm_string, time.time()),
+                    )
+                ),
+                dtype="int64",
+            )
+            if not len(row_ids):
+                return None
+            params = self._faiss.SearchParameters(sel=self._faiss.IDSelectorBatch(row_ids))
+            scores, matches = self._index.search(vector, 1, params=params)
+            if matches[0][0] < 0 or scores[0][0] < self.threshold:
+                return None
+            row = self._db.execute(
+                "SELECT response FROM completions WHERE row_id = ?", (int(matches[0][0]),)
+            ).fetchone()
+        return _loads_generations(row[0]) if row is not None else None
+
+    def update(
+        self,
+        vector: Any,
+        prompt: str,
+        llm_string: str,
+        generations: Sequence[ChatGeneration],
+    ) -> None:
+        """Index a new prompt and persist its generations."""
+        import numpy as np
+
+        response = _dumps_generations(generations)
+        with self._lock:
+            self._refresh_index()
+            if self._index is None:
+                self._index = self._new_index(vector.shape[1])
+            row_id = self._db.execute(
+                "INSERT INTO completions (llm_string, prompt, response, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (llm_string, prompt, response, time.time() + self.ttl_seconds),
+            ).lastrowid
+            self._db.commit()
+            self._index.add_with_ids(vector, np.array([row_id], dtype="int64"))
+            # Readers in other processes only ever see a complete index file
+            temp_path = self._index_path.with_name(f"{self._index_path.name}.{os.getpid()}.tmp")
+            self._faiss.write_index(self._index, str(temp_path))
+            os.replace(temp_path, self._index_path)
+            self._index_stamp = self._stat_index()
+
+
+def _dumps_generations(generations: Sequence[ChatGeneration]) -> str:
+    return json.dumps(
+        [
+            {
+                "message": message_to_dict(generation.message),
+                "generation_info": generation.generation_info,
+            }
+            for generation in generations
+        ]
+    )
+
+
+def _loads_generations(payload: str) -> List[ChatGeneration]:
+    return [
+        ChatGeneration(
+            message=messages_from_dict([item["message"]])[0],
+            generation_info=item["generation_info"],
+        )
+        for item in json.loads(payload)
+    ]
+
+
+def _semantic_query(messages: Sequence[BaseMessage], llm_string: str) -> tuple[str, str]:
+    """Split a prompt into the text to embed and the exact-match scope to look it up in.
+
+    Only the latest message is embedded, so a long shared prefix (earlier turns,
+    fixed instructions) can neither push it past the encoder's token window nor
+    make different questions look alike. The history before it is hashed into
+    the scope, so answers are only reused within the same conversation.
+    """
+    query = get_buffer_string(list(messages[-1:]))
+    history = get_buffer_string(list(messages[:-1]))
+    if not history:
+        return query, llm_string
+    return query, f"{llm_string}\n{hashlib.sha256(history.encode('utf-8')).hexdigest()}"
+
+
+class SemanticCacheChatModel(BaseChatModel):
+    """Chat model wrapper that answers near-duplicate questions from a SemanticCache.
+
+    Only the latest message is matched semantically; everything before it must
+    match exactly (see `_semantic_query`). Prompts that carry per-run context in
+    a single message, such as the graph's answer prompt, should not be routed
+    through this wrapper.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    inner: BaseChatModel
+    semantic_cache: SemanticCache
+
+    def __init__(self, inner: BaseChatModel, semantic_cache: SemanticCache, **kwargs: Any):
+        super().__init__(inner=inner, semantic_cache=semantic_cache, **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"semantic-cache-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.inner._identifying_params
+
+    # Tool-calling and structured output depend on the bound schema, so they
+    # go straight to the wrapped model instead of through the cache.
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Any:
+        return self.inner.bind_tools(tools, **kwargs)
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Any:
+        return self.inner.with_structured_output(schema, **kwargs)
+
+    def _cached_lookup(
+        self, query: str, scope: str
+    ) -> tuple[Any, Optional[List[ChatGeneration]]]:
+        try:
+            vector = self.semantic_cache.embed(query)
+            return vector, self.semantic_cache.lookup(vector, scope)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed, calling the model directly: {e}")
+            return None, None
+
+    def _cached_update(
+        self, vector: Any, prompt: str, scope: str, result: ChatResult
+    ) -> None:
+        if vector is None:
+            return
+        try:
+            self.semantic_cache.update(vector, prompt, scope, result.generations)
+        except Exception as e:
+            logger.warning(f"Failed to store response in semantic cache: {e}")
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = get_buffer_string(messages)
+        llm_string = self.inner._get_llm_string(stop=stop, **kwargs)
+        query, scope = _semantic_query(messages, llm_string)
+        vector, cached = self._cached_lookup(query, scope)
+        if cached is not None:
+            return ChatResult(generations=cached)
+
+        result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._cached_update(vector, prompt, scope, result)
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = get_buffer_string(messages)
+        llm_string = self.inner._get_llm_string(stop=stop, **kwargs)
+        query, scope = _semantic_query(messages, llm_string)
+        loop = asyncio.get_running_loop()
+        inflight = self.semantic_cache.inflight
+        key = cache_key(prompt, llm_string)
+        while True:
+            pending = inflight.get(key)
+            if pending is None or pending.get_loop() is not loop:
+                break
+            shared = await asyncio.shield(pending)
+            if shared is not None:
+                return shared
+            # The leading call was cancelled; waiters make the call themselves
+            # rather than inherit a cancellation that wasn't theirs
+
+        future: "asyncio.Future[Optional[ChatResult]]" = loop.create_future()
+        inflight[key] = future
+        try:
+            result = await self._agenerate_uncoalesced(
+                messages, prompt, query, scope, stop, run_manager, **kwargs
+            )
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no other caller was waiting
+            future.exception()
+            raise
+        except BaseException:
+            future.set_result(None)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if inflight.get(key) is future:
+                del inflight[key]
+
+    async def _agenerate_uncoalesced(
+        self,
+        messages: List[BaseMessage],
+        prompt: str,
+        query: str,
+        scope: str,
+        stop: Optional[List[str]],
+        run_manager: Optional[AsyncCallbackManagerForLLMRun],
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Embedding is CPU-bound, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        vector, cached = await loop.run_in_executor(
+            None, self._cached_lookup, query, scope
+        )
+        if cached is not None:
+            return ChatResult(generations=cached)
+
+        result = await self.inner._agenerate(
+            messages, stop=stop, run_manager=run_manager, **kwargs
+        )
+        await loop.run_in_executor(
+            None, self._cached_update, vector, prompt, scope, result
+        )
+        return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        prompt = get_buffer_string(messages)
+        llm_string = self.inner._get_llm_string(stop=stop, **kwargs)
+        query, scope = _semantic_query(messages, llm_string)
+        vector, cached = self._cached_lookup(query, scope)
+        if cached is not None:
+            yield from _chunks_from_generations(cached)
+            return
+
+        chunks = []
+        for chunk in self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        if chunks:
+            self._cached_update(vector, prompt, scope, generate_from_stream(iter(chunks)))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        prompt = get_buffer_string(messages)
+        llm_string = self.inner._get_llm_string(stop=stop, **kwargs)
+        query, scope = _semantic_query(messages, llm_string)
+        loop = asyncio.get_running_loop()
+        vector, cached = await loop.run_in_executor(
+            None, self._cached_lookup, query, scope
+        )
+        if cached is not None:
+            for chunk in _chunks_from_generations(cached):
+                yield chunk
+            return
+
+        chunks = []
+        async for chunk in self.inner._astream(
+            messages, stop=stop, run_manager=run_manager, **kwargs
+        ):
+            chunks.append(chunk)
+            yield chunk
+        if chunks:
+            await loop.run_in_executor(
+                None,
+                self._cached_update,
+                vector,
+                prompt,
+                scope,
+                generate_from_stream(iter(chunks)),
+            )
+
+
+def _chunks_from_generations(
+    generations: Sequence[ChatGeneration],
+) -> Iterator[ChatGenerationChunk]:
+    """Replay cached generations as single-chunk streams."""
+    for generation in generations:
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content=generation.message.content),
+            generation_info=generation.generation_info,
+        )
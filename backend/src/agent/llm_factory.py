@@ -1,29 +1,228 @@
+import asyncio
+import contextlib
+import json
 import logging
 import os
-from typing import Optional, Union
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+import httpx
+from aiolimiter import AsyncLimiter
 from langchain_core.language_models import BaseChatModel
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
+from openai import AsyncOpenAI
 from agent.configuration import Configuration
+from agent.llm_cache import (
+    SEMANTIC_CACHE_MAX_TEMPERATURE,
+    SemanticCacheChatModel,
+    get_semantic_cache,
+)
 from agent.openrouter_config import OpenRouterConfig
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
 
+# Load environment variables once per process rather than per factory
+load_dotenv()
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+if logger.isEnabledFor(logging.DEBUG):
+    logger.debug("Debug: Environment check in LLMFactory:")
+    logger.debug(f"  - OPENROUTER_API_KEY exists: {OPENROUTER_API_KEY is not None}")
+    logger.debug(f"  - GEMINI_API_KEY exists: {GEMINI_API_KEY is not None}")
+    logger.debug(f"  - Current working directory: {os.getcwd()}")
+
+# Chat models are shared across LLMFactory instances, keyed by everything
+# that goes into their construction
+_llm_instances: Dict[Tuple[Any, ...], BaseChatModel] = {}
+_llm_instances_lock = threading.Lock()
+
+
+# Connection pools shared by every OpenRouter model, so concurrent requests
+# multiplex over kept-alive HTTP/2 connections instead of opening new ones
+_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+# Requests per minute allowed against the OpenRouter key, shared process-wide
+OPENROUTER_RPM = float(os.getenv("OPENROUTER_RPM", "20"))
+_RATE_LIMIT_RETRIES = 3
+# Longer Retry-After delays are handed back to the caller as the 429 itself
+_MAX_RETRY_AFTER_SECONDS = 60.0
+
+# Batch API statuses after which a batch no longer changes
+_BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def _retry_after_seconds(response: httpx.Response, attempt: int) -> float:
+    """Return how long to wait before retrying a 429, honouring Retry-After."""
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return float(2 ** attempt)
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Async transport that paces requests with a token bucket and retries 429s.
+
+    Every request waits on a process-wide ``AsyncLimiter`` of ``OPENROUTER_RPM``
+    requests per minute. A 429 response is retried after exactly the delay the
+    server asks for in ``Retry-After`` (exponential backoff when it's absent),
+    instead of the client library's jittered backoff. Delays longer than
+    ``_MAX_RETRY_AFTER_SECONDS`` are not waited out; the 429 is returned.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        limiter: AsyncLimiter,
+        retries: int = _RATE_LIMIT_RETRIES,
+    ):
+        self._transport = transport
+        self._limiter = limiter
+        self._retries = retries
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(self._retries + 1):
+            async with self._limiter:
+                response = await self._transport.handle_async_request(request)
+            if response.status_code != 429 or attempt == self._retries:
+                return response
+            delay = _retry_after_seconds(response, attempt)
+            if delay > _MAX_RETRY_AFTER_SECONDS:
+                logger.warning(
+                    f"OpenRouter rate limited {request.url.path} for {delay:.0f}s, not retrying"
+                )
+                return response
+            await response.aclose()
+            logger.warning(f"OpenRouter rate limited {request.url.path}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _new_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Create the sync and async clients shared by the OpenRouter models."""
+    return (
+        httpx.Client(http2=True, limits=_HTTP_LIMITS, timeout=60),
+        httpx.AsyncClient(
+            transport=RateLimitedTransport(
+                httpx.AsyncHTTPTransport(http2=True, limits=_HTTP_LIMITS),
+                AsyncLimiter(OPENROUTER_RPM, 60),
+            ),
+            timeout=60,
+        ),
+    )
+
+
+_http_client, _http_async_client = _new_http_clients()
+
+
+# Temperatures the graph nodes create their LLMs with, keyed by model type
+GRAPH_LLM_TEMPERATURES: Dict[str, float] = {
+    "query_generator": 1.0,
+    "reflection": 1.0,
+    "answer": 0.0,
+}
+
+# Whether each graph node lets its LLM answer from the semantic cache. None do:
+# every node sends a single message led by long static instructions, so past
+# the encoder's token window all prompts embed alike, and the answer prompt
+# carries the run's short URLs, which another run's answer would not cite.
+GRAPH_LLM_SEMANTIC_CACHE: Dict[str, bool] = {
+    "query_generator": False,
+    "reflection": False,
+    "answer": False,
+}
+
+# Upper bound on concurrent upstream LLM requests, so the parallel
+# web_research fan-out stays within provider rate limits
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Streamed answers hold their slot for as long as the client takes to read, so
+# they get their own bound instead of starving the graph's calls
+LLM_MAX_STREAMS = int(os.getenv("LLM_MAX_STREAMS", "8"))
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+_stream_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _loop_semaphore(
+    semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]",
+    limit: int,
+) -> asyncio.Semaphore:
+    """Return the running event loop's semaphore from semaphores, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    semaphore = semaphores.get(loop)
+    if semaphore is None:
+        semaphore = semaphores[loop] = asyncio.Semaphore(limit)
+    return semaphore
+
+
+def llm_semaphore() -> asyncio.Semaphore:
+    """Return the semaphore bounding concurrent LLM calls on the running event loop."""
+    return _loop_semaphore(_llm_semaphores, LLM_MAX_CONCURRENCY)
+
+
+def stream_semaphore() -> asyncio.Semaphore:
+    """Return the semaphore bounding concurrent streamed answers on the running event loop."""
+    return _loop_semaphore(_stream_semaphores, LLM_MAX_STREAMS)
+
+
+def open_http_clients() -> None:
+    """Reopen the shared OpenRouter connection pools after `aclose_http_clients`.
+
+    Memoized models keep the clients they were built with, so they are dropped
+    and rebuilt on next use.
+    """
+    global _http_client, _http_async_client
+    with _llm_instances_lock:
+        if _http_client.is_closed or _http_async_client.is_closed:
+            _http_client, _http_async_client = _new_http_clients()
+            _llm_instances.clear()
+
+
+async def aclose_http_clients() -> None:
+    """Close the shared OpenRouter connection pools."""
+    await _http_async_client.aclose()
+    _http_client.close()
+
+
+def _get_or_create_llm(
+    key: Tuple[Any, ...], create: Callable[[], BaseChatModel]
+) -> BaseChatModel:
+    """Return the memoized chat model for key, constructing it on first use."""
+    llm = _llm_instances.get(key)
+    if llm is None:
+        with _llm_instances_lock:
+            llm = _llm_instances.get(key)
+            if llm is None:
+                llm = _llm_instances[key] = create()
+    return llm
+
+
 class LLMFactory:
     """Factory for creating different LLM instances."""
     
     def __init__(self, config: Configuration):
-        # Ensure environment variables are loaded
-        load_dotenv()
-        
-        # Debug: Check what environment variables are available
-        logger.debug(f"Debug: Environment check in LLMFactory:")
-        logger.debug(f"  - OPENROUTER_API_KEY exists: {'OPENROUTER_API_KEY' in os.environ}")
-        logger.debug(f"  - GEMINI_API_KEY exists: {'GEMINI_API_KEY' in os.environ}")
-        logger.debug(f"  - Current working directory: {os.getcwd()}")
-        logger.debug(f"  - Configuration use_openrouter: {config.use_openrouter}")
-        logger.debug(f"  - Configuration query_generator_model: {config.query_generator_model}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"  - Configuration use_openrouter: {config.use_openrouter}")
+            logger.debug(f"  - Configuration query_generator_model: {config.query_generator_model}")
         
         self.config = config
         self.openrouter_config = OpenRouterConfig()
@@ -32,7 +231,8 @@ class LLMFactory:
         self, 
         model_type: str, 
         temperature: float = 0.7,
-        max_retries: int = 2
+        max_retries: int = 2,
+        semantic_cache: bool = True
     ) -> BaseChatModel:
         """
         Create an LLM instance based on the model type.
@@ -41,45 +241,170 @@ class LLMFactory:
             model_type: Type of model to create (query_generator, reflection, answer)
             temperature: Temperature for generation
             max_retries: Number of retries
+            semantic_cache: Whether the model may answer from the semantic cache
+                when it is enabled in the configuration
             
         Returns:
             Configured LLM instance
         """
+        model_name = self._model_name(model_type)
+        llm = self._create_llm_for_model(model_type, model_name, temperature, max_retries)
+
+        # Near-deterministic calls can be answered from the semantic cache
+        if (
+            semantic_cache
+            and temperature < SEMANTIC_CACHE_MAX_TEMPERATURE
+            and self.config.use_semantic_cache
+        ):
+            semantic_cache = get_semantic_cache()
+            if semantic_cache is not None:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"DEBUG: Wrapping {model_type} LLM with semantic cache")
+                # Inner models are memoized for the process, so their id is a stable key
+                key = ("semantic_cache", id(llm), id(semantic_cache), temperature)
+                return _get_or_create_llm(key, lambda: SemanticCacheChatModel(
+                    llm, semantic_cache, cache=self._exact_cache_setting(temperature)
+                ))
+        return llm
+
+    def create_batch_runner(
+        self,
+        temperature: float = 0.0,
+        poll_interval: float = 30.0
+    ) -> Callable[[List[str]], Awaitable[List[str]]]:
+        """
+        Create a coroutine function that runs prompts through the OpenAI Batch API.
+        
+        The prompts are uploaded as a JSONL file, submitted as one batch against
+        /v1/chat/completions with a 24h completion window, and polled until the
+        batch finishes. Requests go to OpenAI with OPENAI_API_KEY and the
+        configured batch_model, unless batch_base_url points them at another
+        endpoint implementing the OpenAI Files and Batch APIs.
+        
+        Args:
+            temperature: Temperature for generation
+            poll_interval: Seconds to wait between batch status checks
+            
+        Returns:
+            Coroutine function mapping prompts to completions, in order
+            
+        Raises:
+            ValueError: If no API key is configured for the batch endpoint
+        """
+        if not OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY environment variable is required for the Batch API")
+        
+        model = self.config.batch_model
+        base_url = self.config.batch_base_url
+        
+        async def run_batch(prompts: List[str]) -> List[str]:
+            requests = "\n".join(
+                json.dumps({
+                    "custom_id": f"request-{idx}",
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": model,
+                        "temperature": temperature,
+                        "messages": [{"role": "user", "content": prompt}],
+                    },
+                })
+                for idx, prompt in enumerate(prompts)
+            )
+            async with AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=base_url) as client:
+                batch_input = await client.files.create(
+                    file=("batch.jsonl", requests.encode("utf-8")), purpose="batch"
+                )
+                batch = await client.batches.create(
+                    input_file_id=batch_input.id,
+                    endpoint="/v1/chat/completions",
+                    completion_window="24h",
+                )
+                try:
+                    while batch.status not in _BATCH_TERMINAL_STATUSES:
+                        await asyncio.sleep(poll_interval)
+                        batch = await client.batches.retrieve(batch.id)
+                except BaseException:
+                    # The caller falls back to a direct call, so don't leave the
+                    # batch running (and billed) in the background
+                    with contextlib.suppress(Exception):
+                        await client.batches.cancel(batch.id)
+                    raise
+                
+                if batch.status != "completed" or not batch.output_file_id:
+                    raise RuntimeError(f"Batch {batch.id} finished with status: {batch.status}")
+                
+                output = await client.files.content(batch.output_file_id)
+            completions = {}
+            for line in output.text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                choices = (response.get("body") or {}).get("choices") or []
+                if record.get("error") or response.get("status_code") != 200 or not choices:
+                    raise RuntimeError(
+                        f"Batch request {record.get('custom_id')} failed: "
+                        f"{record.get('error') or response.get('status_code')}"
+                    )
+                completions[record["custom_id"]] = choices[0]["message"]["content"]
+            missing = [idx for idx in range(len(prompts)) if f"request-{idx}" not in completions]
+            if missing:
+                raise RuntimeError(f"Batch {batch.id} returned no output for requests {missing}")
+            return [completions[f"request-{idx}"] for idx in range(len(prompts))]
+        
+        return run_batch
+
+    def _model_name(self, model_type: str) -> str:
+        """Get the configured model name for a model type."""
         if model_type == "query_generator":
-            model_name = self.config.query_generator_model
+            return self.config.query_generator_model
         elif model_type == "reflection":
-            model_name = self.config.reflection_model
+            return self.config.reflection_model
         elif model_type == "answer":
-            model_name = self.config.answer_model
+            return self.config.answer_model
         else:
             raise ValueError(f"Unknown model type: {model_type}")
-        
+
+    def _create_llm_for_model(
+        self,
+        model_type: str,
+        model_name: str,
+        temperature: float,
+        max_retries: int
+    ) -> BaseChatModel:
+        """Create the provider LLM for a model name, falling back to Gemini on errors."""
         # Debug: Show which model is being used
-        logger.debug(f"DEBUG: Creating {model_type} LLM with model: {model_name}")
-        logger.debug(f"DEBUG: Configuration reasoning_model: {getattr(self.config, 'reasoning_model', 'Not set')}")
-        
-        try:
-            logger.debug(f"DEBUG: model_name: {model_name} with type {model_type}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"DEBUG: Creating {model_type} LLM with model: {model_name}")
+            logger.debug(f"DEBUG: Configuration reasoning_model: {getattr(self.config, 'reasoning_model', 'Not set')}")
             logger.debug(f"DEBUG: self.config.use_openrouter: {self.config.use_openrouter}")
             logger.debug(f"DEBUG: self._is_openrouter_model({model_name}): {self._is_openrouter_model(model_name)}")
-
+        
+        try:
             # Check if it's an OpenRouter model and if OpenRouter is enabled
             if self._is_openrouter_model(model_name) and self.config.use_openrouter:
                 # Check if OpenRouter API key is available before trying to use it
-                if not os.getenv('OPENROUTER_API_KEY'):
-                    logger.debug(f"Warning: OPENROUTER_API_KEY not set, falling back to Gemini for {model_name}")
+                if not OPENROUTER_API_KEY:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"Warning: OPENROUTER_API_KEY not set, falling back to Gemini for {model_name}")
                     return self._create_gemini_llm("gemini-2.0-flash", temperature, max_retries)
                 
                 # Check if we should skip OpenRouter due to previous credit issues
                 if hasattr(self, '_skip_openrouter_due_to_credits'):
-                    logger.debug(f"Warning: Skipping OpenRouter for {model_name} due to previous credit issues, using Gemini")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"Warning: Skipping OpenRouter for {model_name} due to previous credit issues, using Gemini")
                     return self._create_gemini_llm("gemini-2.0-flash", temperature, max_retries)
                 
-                logger.debug(f"Creating OpenRouter LLM with model: {model_name}")
-                return self._create_openrouter_llm(model_name, temperature, max_retries)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Creating OpenRouter LLM with model: {model_name}")
+                # Stream the final answer so tokens reach the client as they are generated
+                streaming = model_type == "answer"
+                return self._create_openrouter_llm(model_name, temperature, max_retries, streaming)
             else:
                 # Fall back to Google Gemini
-                logger.debug(f"Creating Gemini LLM with model: {model_name}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Creating Gemini LLM with model: {model_name}")
                 return self._create_gemini_llm(model_name, temperature, max_retries)
         except Exception as e:
             # Check if it's a credit limit error and provide specific guidance
@@ -100,17 +425,23 @@ class LLMFactory:
                 logger.error(f"Error type: {type(e).__name__}")
                 return self._create_gemini_llm("gemini-2.0-flash", temperature, max_retries)
     
-    def _is_openrouter_model(self, model_name: str) -> bool:
+    @classmethod
+    def _is_openrouter_model(cls, model_name: str) -> bool:
         """Check if the model name corresponds to an OpenRouter model."""
-        result = model_name in self.openrouter_config.FREE_MODELS
-        logger.debug(f"DEBUG: result of {model_name} in {self.openrouter_config.FREE_MODELS} : {result}")
-        return result
+        return model_name in OpenRouterConfig.FREE_MODEL_NAMES
     
+    @staticmethod
+    def _exact_cache_setting(temperature: float) -> Optional[bool]:
+        """Use the global exact-match cache only for deterministic calls."""
+        # None defers to the global cache, False opts the model out of it
+        return None if temperature <= 0 else False
+
     def _create_openrouter_llm(
         self, 
         model_name: str, 
         temperature: float, 
-        max_retries: int
+        max_retries: int,
+        streaming: bool = False
     ) -> ChatOpenAI:
         """Create an OpenRouter LLM instance."""
         # Validate API key and get fresh value from environment
@@ -119,25 +450,34 @@ class LLMFactory:
             raise ValueError("OPENROUTER_API_KEY environment variable is required and cannot be empty")
         
         model_config = self.openrouter_config.get_free_model_config(model_name)
+        # Models that break over OpenRouter's SSE transport opt out in FREE_MODELS
+        streaming = streaming and model_config.get("streaming", True)
         
-        logger.debug(f"Debug: Creating OpenRouter LLM with:")
-        logger.debug(f"  - Model: {model_config['model']}")
-        logger.debug(f"  - Base URL: {self.openrouter_config.base_url}")
-        logger.debug(f"  - Temperature: {temperature}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Debug: Creating OpenRouter LLM with:")
+            logger.debug(f"  - Model: {model_config['model']}")
+            logger.debug(f"  - Base URL: {self.openrouter_config.base_url}")
+            logger.debug(f"  - Temperature: {temperature}")
         
         # Create the LLM with minimal configuration to avoid compatibility issues
         # OpenRouter models work best with basic configuration
-        return ChatOpenAI(
+        key = ("openrouter", model_name, temperature, max_retries, streaming, api_key)
+        return _get_or_create_llm(key, lambda: ChatOpenAI(
             model=model_config["model"],
             openai_api_key=api_key,
             openai_api_base=self.openrouter_config.base_url,
+            # OpenAI and DeepSeek providers cache repeated prompt prefixes
+            # automatically; the prompts keep their static instructions first
+            default_headers=self.openrouter_config.default_headers(),
             temperature=temperature,
             max_retries=max_retries,
-            # Disable streaming to avoid compatibility issues
-            streaming=False,
+            cache=self._exact_cache_setting(temperature),
+            streaming=streaming,
             # Use minimal configuration to avoid version conflicts
-            request_timeout=60
-        )
+            request_timeout=60,
+            http_client=_http_client,
+            http_async_client=_http_async_client,
+        ))
     
     def _create_gemini_llm(
         self, 
@@ -146,12 +486,22 @@ class LLMFactory:
         max_retries: int
     ) -> ChatGoogleGenerativeAI:
         """Create a Google Gemini LLM instance."""
-        return ChatGoogleGenerativeAI(
+        key = (
+            "gemini",
+            model_name,
+            temperature,
+            max_retries,
+            self.config.gemini_api_key,
+            self.config.gemini_cached_content,
+        )
+        return _get_or_create_llm(key, lambda: ChatGoogleGenerativeAI(
             model=model_name,
             temperature=temperature,
             max_retries=max_retries,
-            api_key=self.config.gemini_api_key
-        )
+            api_key=self.config.gemini_api_key,
+            cache=self._exact_cache_setting(temperature),
+            cached_content=self.config.gemini_cached_content,
+        ))
     
     def reset_openrouter_credits_flag(self):
         """Reset the flag that skips OpenRouter due to credit issues."""
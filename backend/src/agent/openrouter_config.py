@@ -1,21 +1,35 @@
+import functools
 import os
 import logging
-from typing import Dict, Any, ClassVar
-from pydantic import BaseModel, Field
+from dataclasses import dataclass, field
+from typing import Dict, Any, ClassVar, FrozenSet, Optional
+
+__all__ = ["OpenRouterConfig"]
 
 logger = logging.getLogger(__name__)
 
-class OpenRouterConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class OpenRouterConfig:
     """Configuration for OpenRouter integration."""
     
-    api_key: str = Field(
+    api_key: Optional[str] = field(
         default_factory=lambda: os.getenv("OPENROUTER_API_KEY"),
-        description="OpenRouter API key"
+        metadata={"description": "OpenRouter API key"}
     )
     
-    base_url: str = Field(
+    base_url: str = field(
         default="https://openrouter.ai/api/v1",
-        description="OpenRouter API base URL"
+        metadata={"description": "OpenRouter API base URL"}
+    )
+    
+    app_url: str = field(
+        default="https://github.com/anhhai680/gemini-fullstack-langgraph-quickstart",
+        metadata={"description": "Application URL sent to OpenRouter as HTTP-Referer"}
+    )
+    
+    app_title: str = field(
+        default="gemini-langgraph",
+        metadata={"description": "Application title sent to OpenRouter as X-Title"}
     )
     
     # Free models available through OpenRouter
@@ -52,6 +66,9 @@ class OpenRouterConfig(BaseModel):
         }
     }
     
+    # Immutable set of the free model names for fast membership checks
+    FREE_MODEL_NAMES: ClassVar[FrozenSet[str]] = frozenset(FREE_MODELS)
+    
     @classmethod
     def get_free_model_config(cls, model_name: str) -> Dict[str, Any]:
         """Get configuration for a specific free model."""
@@ -59,14 +76,26 @@ class OpenRouterConfig(BaseModel):
             raise ValueError(f"Model {model_name} not found in free models")
         return cls.FREE_MODELS[model_name]
     
+    def default_headers(self) -> Dict[str, str]:
+        """Get the attribution headers sent with every OpenRouter request."""
+        return {"HTTP-Referer": self.app_url, "X-Title": self.app_title}
+    
     def validate_api_key(self) -> str:
         """Validate that OpenRouter API key is set and return the key."""
-        logger.debug(f"Debug: OpenRouter API key check - key exists: {bool(self.api_key)}, key length: {len(self.api_key) if self.api_key else 0}")
-        if not self.api_key:
+        return self._validated_key(self.api_key)
+    
+    @classmethod
+    @functools.cache
+    def _validated_key(cls, api_key: Optional[str]) -> str:
+        """Check and strip an API key, once per distinct key."""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Debug: OpenRouter API key check - key exists: {bool(api_key)}, key length: {len(api_key) if api_key else 0}")
+        if not api_key:
             raise ValueError("OPENROUTER_API_KEY environment variable is required")
-        if not self.api_key.strip():
+        if not api_key.strip():
             raise ValueError("OPENROUTER_API_KEY environment variable cannot be empty")
         # Return the first few characters for debugging (safely)
-        safe_key = self.api_key.strip()
-        logger.debug(f"Debug: Using OpenRouter API key starting with: {safe_key[:8]}...")
+        safe_key = api_key.strip()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Debug: Using OpenRouter API key starting with: {safe_key[:8]}...")
         return safe_key
@@ -0,0 +1,129 @@
+import gzip
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install "agent[static]"
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Files up to this size are held in memory together with their compressed variants
+MAX_CACHED_FILE_SIZE = 256 * 1024
+GZIP_COMPRESS_LEVEL = 6
+
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    """Return the content codings a client accepts, dropping those with ``q=0``."""
+    accepted = set()
+    for token in accept_encoding.split(","):
+        coding, _, params = token.partition(";")
+        name, _, value = params.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                if float(value) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves a prebuilt frontend from memory.
+
+    The build directory is walked once on construction. Every file's stat result
+    is kept so lookups never touch the filesystem, and files smaller than
+    ``MAX_CACHED_FILE_SIZE`` are stored as raw bytes plus gzip (and brotli, when
+    installed) payloads that are chosen per request from ``Accept-Encoding``.
+    Larger files and range requests fall back to the regular ``FileResponse``.
+    """
+
+    def __init__(self, *, directory: str, html: bool = False, **kwargs) -> None:
+        super().__init__(directory=directory, html=html, **kwargs)
+        self._lookup: Dict[str, Tuple[str, os.stat_result]] = {}
+        self._payloads: Dict[str, Dict[str, bytes]] = {}
+        # Response headers per file and content coding
+        self._headers: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self._load(directory)
+
+    def _load(self, directory: str) -> None:
+        """Walk the build directory and precompress small files."""
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                full_path = os.path.join(root, filename)
+                stat_result = os.stat(full_path)
+                self._lookup[os.path.relpath(full_path, directory)] = (full_path, stat_result)
+                if stat_result.st_size > MAX_CACHED_FILE_SIZE:
+                    continue
+
+                with open(full_path, "rb") as f:
+                    content = f.read()
+                payloads = {"identity": content}
+                compressed = {"gzip": gzip.compress(content, GZIP_COMPRESS_LEVEL)}
+                if brotli is not None:
+                    compressed["br"] = brotli.compress(content)
+                # Already-compressed formats (images, fonts) don't shrink further
+                payloads.update(
+                    (coding, data) for coding, data in compressed.items() if len(data) < len(content)
+                )
+                self._payloads[full_path] = payloads
+
+                # Reuse FileResponse's content-type, last-modified and etag headers
+                headers = dict(FileResponse(full_path, stat_result=stat_result).headers)
+                headers.pop("content-length", None)
+                headers.pop("accept-ranges", None)
+                headers["vary"] = "Accept-Encoding"
+                variants = {"identity": headers}
+                for coding in payloads.keys() - {"identity"}:
+                    # Strong ETags must differ between encodings of the same resource
+                    variants[coding] = {
+                        **headers,
+                        "content-encoding": coding,
+                        "etag": headers["etag"][:-1] + f'-{coding}"',
+                    }
+                self._headers[full_path] = variants
+
+        logger.info(
+            f"Cached {len(self._payloads)} of {len(self._lookup)} frontend files from {directory}"
+        )
+
+    def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        """Resolve a path from the startup index, falling back to the filesystem."""
+        cached = self._lookup.get(os.path.normpath(path))
+        if cached is not None:
+            return cached
+        return super().lookup_path(path)
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        """Serve a cached payload in the best encoding the client accepts."""
+        payloads = self._payloads.get(str(full_path))
+        request_headers = Headers(scope=scope)
+        if payloads is None or "range" in request_headers:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        coding = "identity"
+        if len(payloads) > 1:
+            accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+            for candidate in ("br", "gzip"):
+                if candidate in payloads and candidate in accepted:
+                    coding = candidate
+                    break
+
+        headers = self._headers[str(full_path)][coding]
+        if self.is_not_modified(Headers(headers), request_headers):
+            return NotModifiedResponse(Headers(headers))
+        return Response(payloads[coding], status_code=status_code, headers=headers)
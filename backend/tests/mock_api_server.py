@@ -2,98 +2,360 @@
 """
 Simple mock API server to test OpenRouter frontend integration.
 This provides the /api/models endpoint without needing the full LangGraph server.
+
+Run with --prebake DIR to checkpoint the ready-to-serve process with CRIU once
+the socket is bound. Containers can then start from the snapshot instead of
+re-importing everything:
+
+    criu restore -D DIR --tcp-established --shell-job
 """
 
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+import argparse
+import asyncio
+import gzip
+import hashlib
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+import orjson
 import uvicorn
+from agent.app import DEFAULT_ALLOWED_ORIGINS
 from agent.openrouter_config import OpenRouterConfig
+from agent.static_files import _accepted_encodings
+
+# Class-level catalogue; no need to build an OpenRouterConfig instance
+_FREE_MODELS = OpenRouterConfig.FREE_MODELS
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
 
-app = FastAPI(title="Mock API Server for OpenRouter Testing")
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+app = FastAPI(
+    title="Mock API Server for OpenRouter Testing",
+    default_response_class=ORJSONResponse,
 )
 
+# Origins the real backend allows by default
+ALLOWED_ORIGINS = DEFAULT_ALLOWED_ORIGINS
+
+async def preflight(request: Request):
+    """Answer CORS preflight requests."""
+    return _responses(request).preflight
+
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Root endpoint."""
-    return {"message": "Mock API Server for OpenRouter Testing"}
+    return _responses(request).root
 
-@app.get("/api/models")
-async def get_available_models():
-    """Get available models including OpenRouter models."""
-    # Get OpenRouter models
-    openrouter_config = OpenRouterConfig()
-    openrouter_models = []
-    
-    for model_name, model_info in openrouter_config.FREE_MODELS.items():
-        openrouter_models.append({
-            "id": model_name,
-            "name": model_name,
-            "provider": "OpenRouter",
-            "provider_icon": "🔗",
-            "category": "Free",
-            "context_length": model_info["context_length"],
-            "description": f"Free {model_info['provider']} model via OpenRouter"
-        })
-    
-    # Get Gemini models
-    gemini_models = [
-        {
-            "id": "gemini-2.0-flash",
-            "name": "2.0 Flash",
-            "provider": "Google",
-            "provider_icon": "⚡",
-            "category": "Paid",
-            "context_length": 8192,
-            "description": "Fast and efficient Gemini model"
-        },
-        {
-            "id": "gemini-2.5-flash-preview-04-17",
-            "name": "2.5 Flash",
-            "provider": "Google",
-            "provider_icon": "⚡",
-            "category": "Paid",
-            "context_length": 8192,
-            "description": "Latest Gemini Flash model"
-        },
-        {
-            "id": "gemini-2.5-pro-preview-05-06",
-            "name": "2.5 Pro",
-            "provider": "Google",
-            "provider_icon": "⚙️",
-            "category": "Paid",
-            "context_length": 8192,
-            "description": "High-quality Gemini Pro model"
-        }
-    ]
-    
+@dataclass(slots=True, frozen=True)
+class ModelRecord:
+    """A model entry in the /api/models response, serialized natively by orjson."""
+
+    id: str
+    name: str
+    provider: str
+    provider_icon: str
+    category: str
+    context_length: int
+    description: str
+
+def _openrouter_columns():
+    """Return the OpenRouter models as one tuple per field (structure of arrays)."""
+    names = tuple(_FREE_MODELS)
+    infos = tuple(_FREE_MODELS.values())
+    count = len(names)
+    return (
+        names,
+        names,
+        ("OpenRouter",) * count,
+        ("🔗",) * count,
+        ("Free",) * count,
+        tuple(info["context_length"] for info in infos),
+        tuple(f"Free {info['provider']} model via OpenRouter" for info in infos),
+    )
+
+# Gemini models, one tuple per ModelRecord field
+_GEMINI_COLUMNS = (
+    ("gemini-2.0-flash", "gemini-2.5-flash-preview-04-17", "gemini-2.5-pro-preview-05-06"),
+    ("2.0 Flash", "2.5 Flash", "2.5 Pro"),
+    ("Google",) * 3,
+    ("⚡", "⚡", "⚙️"),
+    ("Paid",) * 3,
+    (8192,) * 3,
+    ("Fast and efficient Gemini model", "Latest Gemini Flash model", "High-quality Gemini Pro model"),
+)
+
+def _records(columns):
+    """Zip field columns into model records."""
+    return [ModelRecord(*row) for row in zip(*columns)]
+
+def _build_models_payload():
+    """Build the /api/models response body from the static model catalogues."""
     return {
-        "models": openrouter_models + gemini_models,
+        "models": _records(_openrouter_columns()) + _records(_GEMINI_COLUMNS),
         "default_model": "gpt-oss-20b"
     }
 
+# The model list is static, so build it once at import
+_MODELS_PAYLOAD = _build_models_payload()
+_MODELS_BYTES = orjson.dumps(_MODELS_PAYLOAD)
+_MODELS_GZIP = gzip.compress(_MODELS_BYTES, 6)
+_ETAG = '"' + hashlib.blake2b(_MODELS_BYTES, digest_size=8).hexdigest() + '"'
+# Strong ETags must differ between encodings of the same resource
+_GZIP_ETAG = _ETAG[:-1] + '-gzip"'
+
+@dataclass(slots=True, frozen=True)
+class OriginResponses:
+    """Precomputed responses carrying the CORS headers for one request origin."""
+
+    root: Response
+    health: Response
+    preflight: Response
+    models: Response
+    models_gzip: Response
+    models_not_modified: Response
+    models_gzip_not_modified: Response
+
+def _build_responses(origin):
+    """Build every response for requests from origin (None: not an allowed origin)."""
+    # The allowed origin is echoed back, so caches must key on it
+    cors_headers = {"vary": "Origin"}
+    if origin is not None:
+        cors_headers["access-control-allow-origin"] = origin
+    models_headers = {
+        **cors_headers,
+        "cache-control": "public, max-age=60",
+        "vary": "Accept-Encoding, Origin",
+    }
+    return OriginResponses(
+        root=ORJSONResponse(
+            {"message": "Mock API Server for OpenRouter Testing"}, headers=cors_headers
+        ),
+        health=ORJSONResponse(
+            {"status": "healthy", "message": "Mock API server is running"}, headers=cors_headers
+        ),
+        preflight=Response(
+            status_code=204,
+            headers={
+                **cors_headers,
+                "access-control-allow-methods": "GET, OPTIONS",
+                "access-control-allow-headers": "*",
+                # Let browsers cache preflight results for a day
+                "access-control-max-age": "86400",
+            },
+        ),
+        models=Response(
+            content=_MODELS_BYTES,
+            media_type="application/json",
+            headers={
+                **models_headers,
+                "content-length": str(len(_MODELS_BYTES)),
+                "etag": _ETAG,
+            },
+        ),
+        models_gzip=Response(
+            content=_MODELS_GZIP,
+            media_type="application/json",
+            headers={
+                **models_headers,
+                "content-length": str(len(_MODELS_GZIP)),
+                "content-encoding": "gzip",
+                "etag": _GZIP_ETAG,
+            },
+        ),
+        models_not_modified=Response(status_code=304, headers={**models_headers, "etag": _ETAG}),
+        models_gzip_not_modified=Response(
+            status_code=304, headers={**models_headers, "etag": _GZIP_ETAG}
+        ),
+    )
+
+# The CORS policy is fixed, so responses are precomputed per allowed origin
+# instead of being assembled per request by CORSMiddleware. They hold no
+# per-request state, so the same objects are served every time.
+_ORIGIN_RESPONSES = {origin: _build_responses(origin) for origin in ALLOWED_ORIGINS}
+_DISALLOWED_ORIGIN_RESPONSES = _build_responses(None)
+
+def _responses(request):
+    """Return the precomputed responses for the request's Origin."""
+    return _ORIGIN_RESPONSES.get(request.headers.get("origin"), _DISALLOWED_ORIGIN_RESPONSES)
+
+@app.get("/api/models")
+async def get_available_models(request: Request):
+    """Get available models including OpenRouter models."""
+    responses = _responses(request)
+    # Clients that already hold the (immutable) list only get headers back
+    if_none_match = request.headers.get("if-none-match")
+    if "gzip" in _accepted_encodings(request.headers.get("accept-encoding", "")):
+        if if_none_match == _GZIP_ETAG:
+            return responses.models_gzip_not_modified
+        return responses.models_gzip
+    if if_none_match == _ETAG:
+        return responses.models_not_modified
+    return responses.models
+
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
     """Health check endpoint."""
-    return {"status": "healthy", "message": "Mock API server is running"}
+    return _responses(request).health
 
-if __name__ == "__main__":
+# Only the routes this server serves answer preflights, so unknown paths still 404
+for _path in ("/", "/health", "/api/models"):
+    app.add_api_route(_path, preflight, methods=["OPTIONS"], include_in_schema=False)
+
+HOST = "127.0.0.1"
+PORT = 2024
+
+PREWARM_PATHS = ("/api/models", "/health")
+# Give up on prewarming if the server hasn't answered by then (e.g. it failed to start)
+PREWARM_TIMEOUT = 60.0
+
+def prewarm(timeout=PREWARM_TIMEOUT):
+    """Request the hot endpoints once the server is up so real clients hit warm paths.
+
+    Returns False if the server didn't answer within timeout seconds.
+    """
+    deadline = time.monotonic() + timeout
+    for path in PREWARM_PATHS:
+        while True:
+            try:
+                if httpx.get(f"http://{HOST}:{PORT}{path}", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() >= deadline:
+                print(f"⚠️ Server not reachable after {timeout:.0f}s, skipping prewarm")
+                return False
+            time.sleep(0.1)
+    return True
+
+def prebake(snapshot_dir, warm=True):
+    """Dump this process with CRIU as soon as uvicorn accepts connections."""
+    def dump_when_listening():
+        if warm:
+            # Snapshot the warmed-up process
+            prewarm()
+        while True:
+            try:
+                socket.create_connection((HOST, PORT), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        command = shlex.join([
+            "criu", "dump",
+            "-t", str(os.getpid()),
+            "-D", snapshot_dir,
+            "--tcp-established",
+            "--shell-job",
+        ])
+        # Background it from a shell so criu is not part of the dumped process tree
+        subprocess.run(["sh", "-c", f"{command} &"], check=True)
+        print(f"📸 Dumping snapshot to {snapshot_dir}; restore with: criu restore -D {snapshot_dir} --tcp-established --shell-job")
+
+    threading.Thread(target=dump_when_listening, daemon=True).start()
+
+def exec_gunicorn(workers, quiet=False):
+    """Replace this process with gunicorn running the app on several workers."""
+    # Same logging as the single-process server: warnings only, or info plus
+    # an access log on stdout
+    log_args = ["--log-level", "warning"] if quiet else ["--log-level", "info", "--access-logfile", "-"]
+    # --preload imports this module once in the master, so workers share the
+    # precomputed payloads copy-on-write
+    sys.stdout.flush()
+    os.execvp("gunicorn", [
+        "gunicorn",
+        "-w", str(workers),
+        # uvicorn.workers is deprecated in favour of the uvicorn-worker package
+        "-k", "uvicorn_worker.UvicornWorker",
+        "--bind", f"{HOST}:{PORT}",
+        "--preload",
+        *log_args,
+        "--chdir", os.path.dirname(os.path.abspath(__file__)),
+        "mock_api_server:app",
+    ])
+
+def main():
+    """Start the mock server."""
+    parser = argparse.ArgumentParser(description="Mock API server for OpenRouter frontend testing.")
+    parser.add_argument(
+        "--prebake",
+        metavar="DIR",
+        help="Checkpoint the running server into DIR with CRIU once it is listening "
+        "(start later with: criu restore -D DIR --tcp-established --shell-job)",
+    )
+    parser.add_argument(
+        "--no-prewarm",
+        action="store_true",
+        help="Don't request /api/models and /health in the background after startup",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Serve with N gunicorn + UvicornWorker processes when N > 1",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Disable the per-request access log and only log warnings (for load tests)",
+    )
+    args = parser.parse_args()
+    if args.workers > 1 and args.prebake:
+        parser.error("--prebake checkpoints a single process and can't be used with --workers")
+    
     print("🚀 Starting Mock API Server for OpenRouter Testing...")
-    print("📍 Server will run on http://localhost:2024")
-    print("🔗 API endpoint: http://localhost:2024/api/models")
-    print("🌐 CORS enabled for frontend testing")
+    print(f"📍 Server will run on http://localhost:{PORT}")
+    print(f"🔗 API endpoint: http://localhost:{PORT}/api/models")
+    print(f"🌐 CORS enabled for {', '.join(ALLOWED_ORIGINS)}")
     print("\nPress Ctrl+C to stop the server")
     
-    uvicorn.run(
+    if args.workers > 1:
+        # This process becomes the gunicorn master, so prewarm from a child
+        if not args.no_prewarm and os.fork() == 0:
+            prewarm()
+            os._exit(0)
+        exec_gunicorn(args.workers, quiet=args.quiet)
+    
+    if args.prebake:
+        prebake(args.prebake, warm=not args.no_prewarm)
+    elif not args.no_prewarm:
+        threading.Thread(target=prewarm, daemon=True).start()
+    
+    config = uvicorn.Config(
         app,
-        host="127.0.0.1",
-        port=2024,
-        log_level="info"
+        host=HOST,
+        port=PORT,
+        log_level="warning" if args.quiet else "info",
+        access_log=not args.quiet,
+        # C-based HTTP parser from uvicorn[standard]
+        http="httptools",
+        # The mock app has no startup/shutdown handlers
+        lifespan="off",
     )
+    server = uvicorn.Server(config)
+    
+    # Serve on a libuv event loop (uvloop, from uvicorn[standard])
+    import uvloop
+    try:
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(server.serve())
+    except KeyboardInterrupt:
+        # uvicorn re-raises the captured Ctrl+C once the server has shut down
+        pass
+
+if __name__ == "__main__":
+    main()
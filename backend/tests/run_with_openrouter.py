@@ -4,91 +4,177 @@ Startup script for running the LangGraph agent with OpenRouter models.
 This script shows how to configure and start your agent with free models.
 """
 
+import argparse
+import functools
 import os
 import sys
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+
+REQUIRED_VARS = ("OPENROUTER_API_KEY", "GEMINI_API_KEY")
+
+# Static output, pre-joined so each phase is a single write
+_BANNER = "\n".join([
+    "🚀 LangGraph Agent with OpenRouter",
+    "=" * 40,
+])
+_READY = "\n".join([
+    "\n🎯 Your agent is ready to use!",
+    "You can now:",
+    "1. Use the FastAPI server: langgraph dev",
+    "2. Call the graph directly from Python",
+    "3. Use the CLI interface",
+])
+_NEXT_STEPS = "\n".join([
+    "\n📚 Next Steps:",
+    "1. Test your agent with: python3 test_openrouter.py",
+    "2. Run examples with: python3 config_examples.py",
+    "3. Start the server with: langgraph dev",
+    "4. Check the documentation: README_OPENROUTER.md",
+])
+
+def _write(*lines):
+    """Write lines to stdout in one call and flush."""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+@functools.lru_cache(maxsize=1)
+def _load_env():
+    """Load .env once and return the required variables."""
+    # Variables already exported by the shell win over .env anyway
+    if all(var in os.environ for var in REQUIRED_VARS):
+        return {var: os.environ[var] for var in REQUIRED_VARS}
+    
+    # Imported here so --help doesn't pay for it
+    from dotenv import load_dotenv
+    load_dotenv()
+    return {var: os.getenv(var) for var in REQUIRED_VARS}
+
+@functools.lru_cache(maxsize=1)
+def _get_config():
+    """Build the agent Configuration once, with the environment overrides the graph applies."""
+    from agent.configuration import Configuration
+    return Configuration.from_runnable_config()
 
 def check_environment():
     """Check if the environment is properly configured."""
-    load_dotenv()
-    
-    required_vars = ["OPENROUTER_API_KEY", "GEMINI_API_KEY"]
+    env = _load_env()
     missing_vars = []
     
-    for var in required_vars:
-        if not os.getenv(var):
+    for var in REQUIRED_VARS:
+        if not env[var]:
             missing_vars.append(var)
     
     if missing_vars:
-        print("❌ Missing required environment variables:")
-        for var in missing_vars:
-            print(f"   - {var}")
-        print("\nPlease set these variables in your .env file:")
-        print("cp env.template .env")
-        print("Then edit .env with your API keys")
+        _write(
+            "❌ Missing required environment variables:",
+            *(f"   - {var}" for var in missing_vars),
+            "\nPlease set these variables in your .env file:",
+            "cp env.template .env",
+            "Then edit .env with your API keys",
+        )
         return False
     
-    print("✅ Environment is properly configured")
+    _write("✅ Environment is properly configured")
     return True
 
 def show_configuration():
     """Show the current configuration."""
-    print("\n🔧 Current Configuration:")
-    print("-" * 30)
+    config = _get_config()
     
-    from agent.configuration import Configuration
-    config = Configuration()
+    _write(
+        "\n🔧 Current Configuration:",
+        "-" * 30,
+        f"Query Generator: {config.query_generator_model}",
+        f"Reflection Model: {config.reflection_model}",
+        f"Answer Model: {config.answer_model}",
+        f"Use OpenRouter: {config.use_openrouter}",
+        f"Initial Queries: {config.number_of_initial_queries}",
+        f"Max Research Loops: {config.max_research_loops}",
+    )
+
+def prewarm(graph):
+    """Build the graph's LLM clients, and run any node prewarm hooks, in background threads."""
+    from agent.llm_factory import GRAPH_LLM_SEMANTIC_CACHE, GRAPH_LLM_TEMPERATURES, LLMFactory
+    
+    # Same arguments as the graph nodes, so they get these memoized instances
+    factory = LLMFactory(_get_config())
+    tasks = {
+        f"{model_type} LLM": functools.partial(
+            factory.create_llm,
+            model_type,
+            temperature,
+            2,
+            GRAPH_LLM_SEMANTIC_CACHE[model_type],
+        )
+        for model_type, temperature in GRAPH_LLM_TEMPERATURES.items()
+    }
+    for name, node in graph.nodes.items():
+        hook = getattr(node, "prewarm", None)
+        if callable(hook):
+            tasks[f"{name} node"] = hook
+    
+    def report(name, future):
+        if future.exception() is not None:
+            _write(f"⚠️ Prewarming {name} failed: {future.exception()}")
     
-    print(f"Query Generator: {config.query_generator_model}")
-    print(f"Reflection Model: {config.reflection_model}")
-    print(f"Answer Model: {config.answer_model}")
-    print(f"Use OpenRouter: {config.use_openrouter}")
-    print(f"Initial Queries: {config.number_of_initial_queries}")
-    print(f"Max Research Loops: {config.max_research_loops}")
+    # Don't wait: the memoized clients are ready by the time the first query runs
+    executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="prewarm")
+    for name, task in tasks.items():
+        executor.submit(task).add_done_callback(functools.partial(report, name))
+    executor.shutdown(wait=False)
 
 def start_agent():
     """Start the LangGraph agent."""
-    print("\n🚀 Starting LangGraph Agent with OpenRouter...")
-    print("-" * 50)
+    _write("\n🚀 Starting LangGraph Agent with OpenRouter...", "-" * 50)
     
     try:
         # Import the graph
         from agent.graph import graph
         
-        print("✅ Agent graph loaded successfully")
-        print(f"Graph name: {graph.name}")
-        print(f"Graph nodes: {list(graph.nodes.keys())}")
+        prewarm(graph)
         
-        print("\n🎯 Your agent is ready to use!")
-        print("You can now:")
-        print("1. Use the FastAPI server: langgraph dev")
-        print("2. Call the graph directly from Python")
-        print("3. Use the CLI interface")
+        _write(
+            "✅ Agent graph loaded successfully",
+            f"Graph name: {graph.name}",
+            f"Graph nodes: {list(graph.nodes.keys())}",
+            _READY,
+        )
         
     except Exception as e:
-        print(f"❌ Error starting agent: {e}")
-        print("Please check your configuration and try again")
+        _write(
+            f"❌ Error starting agent: {e}",
+            "Please check your configuration and try again",
+        )
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Check and start the LangGraph agent with OpenRouter models.")
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Only check the environment, without importing the agent package (useful for CI smoke tests)",
+    )
+    return parser.parse_args(argv)
 
 def main():
     """Main startup function."""
-    print("🚀 LangGraph Agent with OpenRouter")
-    print("=" * 40)
+    args = parse_args()
+    
+    _write(_BANNER)
     
     # Check environment
     if not check_environment():
         sys.exit(1)
     
-    # Show configuration
-    show_configuration()
-    
-    # Start agent
-    start_agent()
+    # Importing anything from agent loads the graph, LangGraph and langchain
+    if not args.fast:
+        # Show configuration
+        show_configuration()
+        
+        # Start agent
+        start_agent()
     
-    print("\n📚 Next Steps:")
-    print("1. Test your agent with: python3 test_openrouter.py")
-    print("2. Run examples with: python3 config_examples.py")
-    print("3. Start the server with: langgraph dev")
-    print("4. Check the documentation: README_OPENROUTER.md")
+    _write(_NEXT_STEPS)
 
 if __name__ == "__main__":
     main()
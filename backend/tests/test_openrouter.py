@@ -4,11 +4,42 @@ Test script for OpenRouter integration.
 This script tests the LLM factory and OpenRouter configuration.
 """
 
+import asyncio
+import hashlib
+import importlib.util
 import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from pathlib import Path
+import httpx
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.globals import get_llm_cache
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration
 from agent.configuration import Configuration
-from agent.llm_factory import LLMFactory
+from agent.llm_cache import (
+    ExactLLMCache,
+    SemanticCache,
+    SemanticCacheChatModel,
+    cache_key,
+    setup_llm_caching,
+)
+from agent import llm_cache, llm_factory
+from agent.llm_factory import (
+    GRAPH_LLM_SEMANTIC_CACHE,
+    GRAPH_LLM_TEMPERATURES,
+    LLMFactory,
+    RateLimitedTransport,
+    _retry_after_seconds,
+)
 from agent.openrouter_config import OpenRouterConfig
+from agent.static_files import PrecompressedStaticFiles
+import mock_api_server
 
 def test_openrouter_config():
     """Test OpenRouter configuration."""
@@ -18,6 +49,7 @@ def test_openrouter_config():
     print(f"API Key set: {'Yes' if config.api_key else 'No'}")
     print(f"Base URL: {config.base_url}")
     print(f"Available free models: {list(config.FREE_MODELS.keys())}")
+    assert OpenRouterConfig.FREE_MODEL_NAMES == frozenset(OpenRouterConfig.FREE_MODELS)
     
     # Test model config retrieval
     try:
@@ -46,6 +78,12 @@ def test_configuration():
     print(f"Use OpenRouter: {config.use_openrouter}")
     print(f"Gemini API Key set: {'Yes' if config.gemini_api_key else 'No'}")
     
+    # Resolved configurations are memoized per set of values
+    runnable_config = {"configurable": {"reasoning_model": "deepseek-r1"}}
+    resolved = Configuration.from_runnable_config(runnable_config)
+    print(f"Reasoning model override: {resolved.answer_model}")
+    assert Configuration.from_runnable_config(runnable_config) is resolved
+    
     print()
 
 def test_llm_factory():
@@ -60,12 +98,500 @@ def test_llm_factory():
     print(f"Is gemini-2.0-flash an OpenRouter model? {factory._is_openrouter_model('gemini-2.0-flash')}")
     
     # Test LLM creation (without actually calling the API)
+    llm = factory.create_llm("query_generator", temperature=0.7)
+    print(f"✅ Successfully created LLM: {type(llm).__name__}")
+    print(f"Model name: {llm.model_name if hasattr(llm, 'model_name') else 'N/A'}")
+    
+    # Factories share constructed models with identical settings
+    same_llm = LLMFactory(config).create_llm("query_generator", temperature=0.7)
+    print(f"Reused cached LLM instance: {same_llm is llm}")
+    assert same_llm is llm
+    
+    # The answer node's model, created the way finalize_answer does
+    answer_llm = factory.create_llm(
+        "answer",
+        temperature=GRAPH_LLM_TEMPERATURES["answer"],
+        semantic_cache=GRAPH_LLM_SEMANTIC_CACHE["answer"],
+    )
+    same_answer_llm = LLMFactory(config).create_llm(
+        "answer",
+        temperature=GRAPH_LLM_TEMPERATURES["answer"],
+        semantic_cache=GRAPH_LLM_SEMANTIC_CACHE["answer"],
+    )
+    assert same_answer_llm is answer_llm
+    
+    # Models wrapped with the semantic cache are shared as well
+    if importlib.util.find_spec("faiss") is not None:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            previous_cache = llm_cache._semantic_cache
+            llm_cache._semantic_cache = SemanticCache(cache_dir=Path(cache_dir))
+            try:
+                cached_config = Configuration(use_semantic_cache=True)
+                wrapped = LLMFactory(cached_config).create_llm("answer", temperature=0.0)
+                same_wrapped = LLMFactory(cached_config).create_llm("answer", temperature=0.0)
+            finally:
+                llm_cache._semantic_cache = previous_cache
+        print(f"Reused wrapped LLM instance: {same_wrapped is wrapped}")
+        assert isinstance(wrapped, SemanticCacheChatModel)
+        assert same_wrapped is wrapped
+    
+    print()
+
+def test_http_clients_reopen():
+    """Test that a closed connection pool is replaced along with the models using it."""
+    print("Testing HTTP Client Reopening...")
+    
+    factory = LLMFactory(Configuration())
+    llm = factory.create_llm("answer", temperature=0.0)
+    
+    # What an app shutdown followed by another startup does
+    asyncio.run(llm_factory.aclose_http_clients())
+    llm_factory.open_http_clients()
+    
+    assert not llm_factory._http_client.is_closed
+    assert not llm_factory._http_async_client.is_closed
+    assert factory.create_llm("answer", temperature=0.0) is not llm
+    # Open clients are left alone
+    reopened = llm_factory._http_async_client
+    llm_factory.open_http_clients()
+    assert llm_factory._http_async_client is reopened
+    print("✅ Closed clients replaced")
+    
+    print()
+
+def test_rate_limited_transport():
+    """Test Retry-After parsing and 429 retries in the OpenRouter transport."""
+    print("Testing Rate Limited Transport...")
+    
+    def too_many_requests(retry_after=None):
+        headers = {"retry-after": retry_after} if retry_after is not None else {}
+        return httpx.Response(429, headers=headers)
+    
+    soon = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert _retry_after_seconds(too_many_requests("7"), 0) == 7.0
+    assert 25 < _retry_after_seconds(too_many_requests(soon), 0) <= 30
+    assert _retry_after_seconds(too_many_requests("Thu, 01 Jan 1970 00:00:00 GMT"), 0) == 0.0
+    assert _retry_after_seconds(too_many_requests(), 2) == 4.0
+    assert _retry_after_seconds(too_many_requests("soon"), 1) == 2.0
+    
+    async def send(retry_after):
+        calls = []
+        
+        def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                return too_many_requests(retry_after)
+            return httpx.Response(200, json={"ok": True})
+        
+        transport = RateLimitedTransport(httpx.MockTransport(handler), AsyncLimiter(100, 1))
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await asyncio.wait_for(client.get("https://openrouter.test/api"), 5)
+        return response.status_code, len(calls)
+    
+    # Short delays are waited out and the request retried
+    assert asyncio.run(send("0")) == (200, 2)
+    # Delays past the cap return the 429 instead of sleeping for them
+    assert asyncio.run(send("Fri, 01 Jan 2099 00:00:00 GMT")) == (429, 1)
+    assert asyncio.run(send("3600")) == (429, 1)
+    print("✅ Retry-After honoured and capped")
+    
+    print()
+
+def test_batch_runner():
+    """Test that the batch runner closes its client and cancels batches it abandons."""
+    print("Testing Batch Runner...")
+    
+    requests = []
+    clients = []
+    
+    def handler(request):
+        requests.append((request.method, request.url.path))
+        path = request.url.path
+        batch = {
+            "id": "batch-1",
+            "object": "batch",
+            "endpoint": "/v1/chat/completions",
+            "input_file_id": "file-in",
+            "completion_window": "24h",
+            "created_at": 0,
+            "status": status,
+            "output_file_id": "file-out" if status == "completed" else None,
+        }
+        if path.endswith("/files"):
+            return httpx.Response(200, json={
+                "id": "file-in", "object": "file", "bytes": 1, "created_at": 0,
+                "filename": "batch.jsonl", "purpose": "batch", "status": "processed",
+            })
+        if path.endswith("/files/file-out/content"):
+            record = {
+                "custom_id": "request-0",
+                "response": {"status_code": 200, "body": {"choices": [{"message": {"content": "batched"}}]}},
+            }
+            return httpx.Response(200, json=record)
+        if path.endswith("/cancel"):
+            return httpx.Response(200, json={**batch, "status": "cancelling"})
+        return httpx.Response(200, json=batch)
+    
+    def mock_client(**kwargs):
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        clients.append(http_client)
+        return real_client(http_client=http_client, **kwargs)
+    
+    real_client = llm_factory.AsyncOpenAI
+    previous_key = llm_factory.OPENAI_API_KEY
+    llm_factory.AsyncOpenAI = mock_client
+    llm_factory.OPENAI_API_KEY = "sk-test"
     try:
-        llm = factory.create_llm("query_generator", temperature=0.7)
-        print(f"✅ Successfully created LLM: {type(llm).__name__}")
-        print(f"Model name: {llm.model_name if hasattr(llm, 'model_name') else 'N/A'}")
-    except Exception as e:
-        print(f"❌ Error creating LLM: {e}")
+        run_batch = LLMFactory(Configuration()).create_batch_runner(poll_interval=0.01)
+        
+        status = "completed"
+        assert asyncio.run(run_batch(["prompt"])) == ["batched"]
+        assert clients[-1].is_closed
+        
+        # A batch that never finishes is cancelled once the caller gives up
+        status = "in_progress"
+        
+        async def give_up():
+            try:
+                await asyncio.wait_for(run_batch(["prompt"]), 0.1)
+            except asyncio.TimeoutError:
+                return True
+            return False
+        
+        assert asyncio.run(give_up())
+        assert ("POST", "/v1/batches/batch-1/cancel") in requests
+        assert clients[-1].is_closed
+        print("✅ Abandoned batch cancelled, clients closed")
+    finally:
+        llm_factory.AsyncOpenAI = real_client
+        llm_factory.OPENAI_API_KEY = previous_key
+    
+    print()
+
+def test_exact_llm_cache():
+    """Test the exact-match LLM cache."""
+    print("Testing Exact LLM Cache...")
+    
+    assert cache_key("prompt", "llm") == cache_key("prompt", "llm")
+    assert cache_key("prompt", "llm-a") != cache_key("prompt", "llm-b")
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ExactLLMCache(Path(cache_dir) / "cache.sqlite3")
+        assert cache.lookup("prompt", "llm") is None
+        
+        cache.update("prompt", "llm", [ChatGeneration(message=AIMessage(content="cached"))])
+        cached = cache.lookup("prompt", "llm")
+        print(f"Cached response: {cached[0].message.content}")
+        assert cached[0].message.content == "cached"
+        assert cache.lookup("prompt", "other-llm") is None
+        
+        cache.clear()
+        assert cache.lookup("prompt", "llm") is None
+        
+        # An unusable location leaves the global cache as it was instead of raising
+        blocker = Path(cache_dir) / "not-a-directory"
+        blocker.write_text("")
+        previous_cache = get_llm_cache()
+        setup_llm_caching(blocker / "cache.sqlite3")
+        assert get_llm_cache() is previous_cache
+        print("✅ Unwritable cache directory skipped")
+    
+    print()
+
+class HashEncoder:
+    """Deterministic stand-in for the embedding model.
+    
+    Like the real model it only sees the start of its input (here 256
+    characters), and equal inputs give equal vectors.
+    """
+    
+    window = 256
+    
+    def encode(self, sentences, normalize_embeddings=True, convert_to_numpy=True):
+        import numpy as np
+        
+        vectors = np.array(
+            [list(hashlib.sha256(text[:self.window].encode()).digest()[:16]) for text in sentences],
+            dtype="float32",
+        ) - 127.5
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_semantic_cache_follow_ups():
+    """Test that follow-ups sharing a conversation prefix don't share answers."""
+    print("Testing Semantic Cache Follow-ups...")
+    
+    if importlib.util.find_spec("faiss") is None:
+        print("faiss not installed, skipping")
+        return
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        semantic_cache = SemanticCache(cache_dir=Path(cache_dir))
+        semantic_cache._encoder = HashEncoder()
+        llm = SemanticCacheChatModel(
+            FakeListChatModel(responses=["first", "second", "third"]), semantic_cache
+        )
+        history = [HumanMessage("What is LangGraph?"), AIMessage("A library. " * 300)]
+        
+        first = llm.invoke(history + [HumanMessage("Who maintains it?")])
+        second = llm.invoke(history + [HumanMessage("What license is it under?")])
+        print(f"Follow-up answers: {first.content!r}, {second.content!r}")
+        assert (first.content, second.content) == ("first", "second")
+        
+        # The same follow-up in the same conversation is answered from the cache
+        assert llm.invoke(history + [HumanMessage("Who maintains it?")]).content == "first"
+        # ...but not after a different conversation history
+        other = llm.invoke([HumanMessage("What is FAISS?"), HumanMessage("Who maintains it?")])
+        assert other.content == "third"
+    
+    print()
+
+class CountingChatModel(FakeListChatModel):
+    """Fake model that counts its (slow) async calls."""
+    
+    calls: int = 0
+    
+    async def _agenerate(self, *args, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return await super()._agenerate(*args, **kwargs)
+
+def test_semantic_cache_single_flight():
+    """Test that identical concurrent calls through separate wrappers coalesce."""
+    print("Testing Semantic Cache Single-flight...")
+    
+    if importlib.util.find_spec("faiss") is None:
+        print("faiss not installed, skipping")
+        return
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        semantic_cache = SemanticCache(cache_dir=Path(cache_dir))
+        semantic_cache._encoder = HashEncoder()
+        inner = CountingChatModel(responses=["answer"])
+        
+        async def ask_twice():
+            # Graph nodes build a fresh wrapper per run
+            first = SemanticCacheChatModel(inner, semantic_cache)
+            second = SemanticCacheChatModel(inner, semantic_cache)
+            return await asyncio.gather(first.ainvoke("question"), second.ainvoke("question"))
+        
+        results = asyncio.run(ask_twice())
+        print(f"Upstream calls for 2 concurrent requests: {inner.calls}")
+        assert [result.content for result in results] == ["answer", "answer"]
+        assert inner.calls == 1
+        assert not semantic_cache.inflight
+    
+    print()
+
+def test_semantic_cache_scoped_lookup():
+    """Test that closer entries from other scopes don't hide a match in scope."""
+    print("Testing Semantic Cache Scoped Lookup...")
+    
+    if importlib.util.find_spec("faiss") is None:
+        print("faiss not installed, skipping")
+        return
+    
+    import numpy as np
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        semantic_cache = SemanticCache(cache_dir=Path(cache_dir))
+        query = HashEncoder().encode(["What is LangGraph?"])
+        nearby = query + 0.05 * HashEncoder().encode(["noise"])
+        nearby /= np.linalg.norm(nearby)
+        
+        # Exact matches from other conversations and models...
+        for scope in range(8):
+            semantic_cache.update(
+                query, "", f"other-{scope}", [ChatGeneration(message=AIMessage("other"))]
+            )
+        # ...sit closer to the query than the entry in scope
+        semantic_cache.update(nearby, "", "llm", [ChatGeneration(message=AIMessage("mine"))])
+        
+        cached = semantic_cache.lookup(query, "llm")
+        print(f"In-scope answer: {cached[0].message.content if cached else None!r}")
+        assert cached is not None and cached[0].message.content == "mine"
+        assert semantic_cache.lookup(query, "unknown") is None
+    
+    print()
+
+def test_semantic_cache_cancelled_leader():
+    """Test that cancelling the leading call doesn't cancel identical waiting calls."""
+    print("Testing Semantic Cache Cancelled Leader...")
+    
+    if importlib.util.find_spec("faiss") is None:
+        print("faiss not installed, skipping")
+        return
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        semantic_cache = SemanticCache(cache_dir=Path(cache_dir))
+        semantic_cache._encoder = HashEncoder()
+        inner = CountingChatModel(responses=["answer"])
+        
+        async def cancel_leader():
+            leader = asyncio.create_task(
+                SemanticCacheChatModel(inner, semantic_cache).ainvoke("question")
+            )
+            await asyncio.sleep(0.01)
+            waiter = asyncio.create_task(
+                SemanticCacheChatModel(inner, semantic_cache).ainvoke("question")
+            )
+            await asyncio.sleep(0.01)
+            # e.g. the leader's client disconnected
+            leader.cancel()
+            result = await waiter
+            return leader.cancelled(), result
+        
+        leader_cancelled, result = asyncio.run(cancel_leader())
+        print(f"Waiter answer after leader cancelled: {result.content!r}")
+        assert leader_cancelled
+        assert result.content == "answer"
+        assert inner.calls == 2
+        assert not semantic_cache.inflight
+    
+    print()
+
+def test_semantic_cache_shared_directory():
+    """Test that caches sharing a directory, like separate processes, keep entries apart."""
+    print("Testing Semantic Cache Shared Directory...")
+    
+    if importlib.util.find_spec("faiss") is None:
+        print("faiss not installed, skipping")
+        return
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        caches = [SemanticCache(cache_dir=Path(cache_dir)) for _ in range(2)]
+        for semantic_cache in caches:
+            semantic_cache._encoder = HashEncoder()
+        first, second = caches
+        
+        def generations(text):
+            return [ChatGeneration(message=AIMessage(text))]
+        
+        def answer(semantic_cache, question):
+            cached = semantic_cache.lookup(semantic_cache.embed(question), "llm")
+            return cached[0].message.content if cached else None
+        
+        # Each cache loaded the (empty) directory before either one wrote to it
+        first.update(first.embed("Who maintains LangGraph?"), "", "llm", generations("LangChain"))
+        second.update(second.embed("What is FAISS?"), "", "llm", generations("A vector index"))
+        
+        for semantic_cache in caches:
+            assert answer(semantic_cache, "Who maintains LangGraph?") == "LangChain"
+            assert answer(semantic_cache, "What is FAISS?") == "A vector index"
+        # A restarted process sees both entries
+        restarted = SemanticCache(cache_dir=Path(cache_dir))
+        restarted._encoder = HashEncoder()
+        assert answer(restarted, "Who maintains LangGraph?") == "LangChain"
+        assert answer(restarted, "What is FAISS?") == "A vector index"
+        assert not list(Path(cache_dir).glob("*.tmp"))
+        print("✅ Both entries answered from either cache")
+    
+    print()
+
+def test_mock_api_server_routes():
+    """Test the mock server's routes, preflights and CORS origins."""
+    print("Testing Mock API Server Routes...")
+    
+    client = TestClient(mock_api_server.app)
+    
+    response = client.get("/does-not-exist")
+    print(f"Unknown path: {response.status_code}")
+    assert response.status_code == 404
+    
+    for path in ("/", "/health", "/api/models"):
+        response = client.options(
+            path,
+            headers={
+                "Origin": "http://localhost:5173",
+                "Access-Control-Request-Method": "GET",
+            },
+        )
+        assert response.status_code == 204
+        assert response.headers["access-control-allow-origin"] == "http://localhost:5173"
+        assert "GET" in response.headers["access-control-allow-methods"]
+    print("Preflight for /, /health, /api/models: 204")
+    
+    # Allowed origins are echoed back; others get no CORS grant
+    for origin in mock_api_server.ALLOWED_ORIGINS:
+        for path in ("/", "/health", "/api/models"):
+            response = client.get(path, headers={"Origin": origin})
+            assert response.headers["access-control-allow-origin"] == origin
+            assert "Origin" in response.headers["vary"]
+    response = client.get("/api/models", headers={"Origin": "https://evil.example"})
+    assert response.status_code == 200
+    assert "access-control-allow-origin" not in response.headers
+    print(f"CORS origins echoed: {', '.join(mock_api_server.ALLOWED_ORIGINS)}")
+    
+    print()
+
+def test_mock_api_server_encoding():
+    """Test that the mock server honours q-values in Accept-Encoding."""
+    print("Testing Mock API Server Encoding...")
+    
+    client = TestClient(mock_api_server.app)
+    
+    for accept_encoding, expected in (
+        ("gzip", "gzip"),
+        ("gzip;q=0.5, identity", "gzip"),
+        ("gzip;q=0, identity", None),
+        ("identity", None),
+    ):
+        response = client.get("/api/models", headers={"Accept-Encoding": accept_encoding})
+        print(f"Accept-Encoding {accept_encoding!r}: {response.headers.get('content-encoding')}")
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") == expected
+        assert response.json()["default_model"] == "gpt-oss-20b"
+        
+        # The ETag identifies the encoding that was served
+        cached = client.get(
+            "/api/models",
+            headers={"Accept-Encoding": accept_encoding, "If-None-Match": response.headers["etag"]},
+        )
+        assert cached.status_code == 304
+    
+    print()
+
+def test_precompressed_static_files():
+    """Test encoding negotiation, conditional and range requests for the frontend files."""
+    print("Testing Precompressed Static Files...")
+    
+    with tempfile.TemporaryDirectory() as build_dir:
+        script = "console.log('hello from the frontend');\n" * 200
+        Path(build_dir, "index.html").write_text("<html>" + "<p>app</p>" * 100 + "</html>")
+        Path(build_dir, "app.js").write_text(script)
+        frontend = FastAPI()
+        frontend.mount("/", PrecompressedStaticFiles(directory=build_dir, html=True))
+        client = TestClient(frontend)
+        
+        identity = client.get("/app.js", headers={"Accept-Encoding": "identity"})
+        gzipped = client.get("/app.js", headers={"Accept-Encoding": "gzip"})
+        refused = client.get("/app.js", headers={"Accept-Encoding": "gzip;q=0, identity"})
+        print(f"ETags: {identity.headers['etag']} / {gzipped.headers['etag']}")
+        assert "content-encoding" not in identity.headers
+        assert gzipped.headers["content-encoding"] == "gzip"
+        assert "content-encoding" not in refused.headers
+        assert identity.text == gzipped.text == script
+        assert gzipped.headers["etag"] != identity.headers["etag"]
+        assert refused.headers["etag"] == identity.headers["etag"]
+        
+        # A cached variant is only revalidated by its own ETag
+        revalidated = client.get(
+            "/app.js", headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["etag"]}
+        )
+        assert revalidated.status_code == 304
+        assert revalidated.headers["etag"] == gzipped.headers["etag"]
+        mismatched = client.get(
+            "/app.js", headers={"Accept-Encoding": "gzip", "If-None-Match": identity.headers["etag"]}
+        )
+        assert mismatched.status_code == 200
+        
+        # Range requests fall back to FileResponse
+        partial = client.get("/app.js", headers={"Range": "bytes=0-6"})
+        assert partial.status_code == 206
+        assert partial.content == b"console"
+        
+        assert client.get("/").text.startswith("<html>")
+        assert client.get("/missing.js").status_code == 404
+        print("✅ Negotiation, 304, range and 404 handled")
     
     print()
 
@@ -98,6 +624,18 @@ def main():
     test_openrouter_config()
     test_configuration()
     test_llm_factory()
+    test_http_clients_reopen()
+    test_rate_limited_transport()
+    test_batch_runner()
+    test_exact_llm_cache()
+    test_semantic_cache_follow_ups()
+    test_semantic_cache_single_flight()
+    test_semantic_cache_scoped_lookup()
+    test_semantic_cache_cancelled_leader()
+    test_semantic_cache_shared_directory()
+    test_mock_api_server_routes()
+    test_mock_api_server_encoding()
+    test_precompressed_static_files()
     
     print("✅ Test suite completed!")
 